@@ -6,25 +6,29 @@
 
 import pickle
 import re
+import statistics
+import subprocess
 import sys
 import time
 import os
 import glob
+import heapq
 import argparse
+import csv
 import json
-from datetime import datetime
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from collections import namedtuple
+import queue
+import socket
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from html.parser import HTMLParser
+from urllib.parse import urlencode, urljoin, urlsplit
 
-import matplotlib
-# Use a non-interactive backend so plotting can work on a headless server
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import numpy as np
+# Selenium, matplotlib and NumPy are imported inside the functions that need
+# them, so `--help`, HTTP/collect-only runs and `render` start quickly
 
 ######################
 # User-configurable
@@ -33,42 +37,273 @@ import numpy as np
 # Where to save the final figure
 OUTPUT_FIGURE_PATH = "/path/to/working/folder/output"
 
+# Files written per figure (also set with --formats): any of "png", "svg",
+# "pdf" and "json" (a summary of the bars). With RENDER_CACHE, a figure whose
+# results and labels are unchanged since the last one is not redrawn.
+FIGURE_FORMATS = ["png"]
+RENDER_CACHE = True
+RENDER_CACHE_FILE = ".render_cache.json"
+
+# --profile saves its cProfile stats as MARACOOS_Profile_<time>.prof in
+# OUTPUT_FIGURE_PATH; profiles older than PROFILE_KEEP_DAYS are deleted then.
+PROFILE_KEEP_DAYS = 14
+
+# Static HTML dashboard (also enabled with --dashboard): the latest figure plus
+# per-site sparklines over the last DASHBOARD_WINDOW_DAYS, averaged per
+# DASHBOARD_BUCKET_HOURS. Building it also prunes the output folder: every
+# figure is kept for FIGURE_KEEP_ALL_DAYS, then one per day until
+# FIGURE_KEEP_DAILY_DAYS, after which figures are deleted.
+DASHBOARD = False
+DASHBOARD_PATH = "/path/to/working/folder/dashboard"
+DASHBOARD_WINDOW_DAYS = 90
+DASHBOARD_BUCKET_HOURS = 12
+FIGURE_KEEP_ALL_DAYS = 2
+FIGURE_KEEP_DAILY_DAYS = 90
+
+# Alerts: every run is compared with the last known state of each site, and an
+# event is sent only when a volume changes colour band, a site fails
+# ALERT_FAILURE_RUNS collections in a row (or recovers), or the forecast puts
+# red within ALERT_FORECAST_DAYS. A volume drops into a worse band at once but
+# only counts as back in a better one ALERT_HYSTERESIS points above its
+# threshold, so readings hovering at a threshold don't flap. Every sink below
+# gets each run's new events; an empty list disables alerting. For example:
+#   {"type": "file", "path": "/path/to/working/folder/alerts.jsonl"}
+#   {"type": "webhook", "url": "https://hooks.example.com/services/..."}
+#   {"type": "command", "command": ["mail", "-s", "MARACOOS storage", "ops@example.com"]}
+ALERT_SINKS = []
+ALERT_STATE_FILE = "/path/to/working/folder/alert_state.json"
+ALERT_HYSTERESIS = 2
+ALERT_FAILURE_RUNS = 2
+ALERT_FORECAST_DAYS = 7
+
 # If your server or environment can't open a GUI, we should run in headless mode:
 HEADLESS = True
 
+# Restart the browser after this many sites, or once Chrome's resident memory
+# passes this many MB (None disables either limit)
+DRIVER_RECYCLE_SITES = 50
+DRIVER_MAX_RSS_MB = 1500
+
+# Lean browsing: block resources the login and storage extraction don't need
+# (also enabled with --lean). Patterns are passed to Chrome's Network.setBlockedURLs.
+LEAN_MODE = False
+LEAN_BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.bmp", "*.ico", "*.svg", "*.webp",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot", "*.css",
+]
+
 # WebDriver Path (change according to your driver)
 CHROME_DRIVER_PATH = "/path/to/working/folder/chromedriver-mac-arm64/chromedriver"
 
 # Cookie path
 COOKIE_PATH = "/path/to/working/folder/cookies"
 
+# Consolidated session cache (inside COOKIE_PATH), and how long a cached session
+# is trusted after it was last accepted by a site
+SESSION_CACHE_FILE = "session_cache.json"
+SESSION_MAX_AGE_HOURS = 24
+# Write the session cache at most this often (seconds); pending changes are
+# written by the next save or when the script exits
+SESSION_SAVE_INTERVAL = 5
+
+# Per-phase timing exports: a JSON-lines log appended every run, and a file for
+# the Prometheus node_exporter textfile collector
+METRICS_PATH = "/path/to/working/folder/metrics"
+TIMINGS_JSONL_FILE = "collector_timings.jsonl"
+PROMETHEUS_FILE = "maracoos_collector.prom"
+
+# Per-site results are appended here (daily JSON lines + CSV) as they are
+# collected; --resume skips sites with a successful result this recent
+RESULTS_STREAM_PATH = "/path/to/working/folder/results"
+RESUME_WINDOW_MINUTES = 60
+
+# Content-addressed archive of fetched /details pages (also enabled with
+# --archive), re-parsed offline by the `replay` command
+ARCHIVE_PAGES = False
+ARCHIVE_PATH = "/path/to/working/folder/page_archive"
+
+# Latest collected results, read back by the `render` command
+RESULTS_FILE = "/path/to/working/folder/latest_results.json"
+
+# `merge` flags shards whose run started this long before the newest shard's
+SHARD_MAX_SKEW_MINUTES = 30
+
+# SQLite file that keeps every run's per-site results
+HISTORY_DB_PATH = "/path/to/working/folder/storage_history.db"
+
 # Credentials file path (JSON file containing login information)
 CREDENTIALS_FILE = "credentials.json"
 
+# Site inventory (JSON file next to the script): every site's host template,
+# frequency group, timeouts, collection priority and enabled flag
+SITE_INVENTORY_FILE = "sites.json"
+
+# `bench micro`: the recorded inputs it runs on and the stored baseline timings
+# (both next to the script, and not committed). Until they are written with
+# --record-inputs / --save-baseline, the reference copies committed in
+# BENCH_REFERENCE_DIR are used. A benchmark whose best time is more than
+# BENCH_REGRESSION_TOLERANCE slower than its baseline fails the suite.
+BENCH_INPUTS_FILE = "bench_inputs.json"
+BENCH_BASELINE_FILE = "bench_baseline.json"
+BENCH_REFERENCE_DIR = "bench_data"
+BENCH_REGRESSION_TOLERANCE = 0.25
+
+# Fill-rate forecasting: how many days of history to fit, and the minimum
+# number of readings a volume needs before a forecast is reported
+FORECAST_WINDOW_DAYS = 14
+FORECAST_MIN_SAMPLES = 3
+# Crossings further out than this are not reported
+FORECAST_HORIZON_DAYS = 365
+
+# Maximum number of sites polled at once by the HTTP backend (--backend http),
+# each on its own worker thread
+HTTP_CONCURRENCY = 8
+
+# Circuit breaker for unreachable sites: open after this many consecutive
+# timeouts, then skip the site for a backoff that doubles on every re-open
+SITE_HEALTH_FILE = "/path/to/working/folder/site_health.json"
+CIRCUIT_FAILURE_THRESHOLD = 3
+CIRCUIT_BASE_BACKOFF = 30 * 60
+CIRCUIT_MAX_BACKOFF = 24 * 60 * 60
+CIRCUIT_PROBE_TIMEOUT = 3
+
+# --watch polling intervals in seconds: red/orange or filling fast, yellow or
+# filling slowly, and green and stable. "Fast"/"slowly" mean the forecast says
+# the red band is fewer than WATCH_FAST_FILL_DAYS / WATCH_SLOW_FILL_DAYS away.
+WATCH_MIN_INTERVAL = 5 * 60
+WATCH_BASE_INTERVAL = 15 * 60
+WATCH_MAX_INTERVAL = 60 * 60
+WATCH_FAST_FILL_DAYS = 7
+WATCH_SLOW_FILL_DAYS = 30
+
 # Debug mode - set to True to see detailed output about what's found on each page
 DEBUG_MODE = False
 
-site_list = [
-    'NANT', 'BLCK', 'AMAG', 'MRCH', 'HEMP', 'HOOK', 'LOVE', 'BRIG', 'WILD', # 5 MHz
-    'SILD', 'OLDB', 'PORT', 'CAPE', 'CMPT', 'LEWE', 'HLPN',                 # 25 MHz
-    'SEAB', 'BRAD', 'SPRK', 'HLGT', 'BRMR', 'RATH', 'WOOD'                  # 13 MHz
-]
-
-print("Spinning up WebDriver...")
-rws_link_prefix = 'http://'
-rws_link_suffix = '-maracoos.dyndns.org:8240'
+# Optional override for the site URL, e.g. 'http://127.0.0.1:8240/{site}' to
+# point the collector at a local stand-in server. None uses each site's
+# host template from the inventory.
+rws_url_template = None
 
 # Global variables for credentials (loaded from JSON)
 username = None
 password_dict = None
 
-def load_credentials():
+# WebDriver calls saved per site by parsing page_source once in get_storage_info
+rpc_savings = {}
+
+######################
+# Site inventory
+######################
+
+# Built-in values for anything the inventory's "defaults" block leaves out.
+# Timeouts are in seconds; sites with a higher priority are collected first.
+SITE_DEFAULTS = {
+    "host": None,
+    "group": None,
+    "page_load_timeout": 25,
+    "details_timeout": 15,
+    "login_wait": 5,
+    "login_timeout": 15,
+    "priority": 0,
+    "enabled": True,
+}
+
+
+class Site(namedtuple('Site', ['name'] + list(SITE_DEFAULTS))):
+    """One site from the inventory, with the defaults filled in."""
+    __slots__ = ()
+
+
+class SiteInventory:
+    """
+    The sites from the inventory file, in file order (which is also the order
+    of the figure, where a change of `group` starts a new block), indexed by
+    name so per-site lookups don't scan the list.
+    """
+
+    def __init__(self, defaults, entries):
+        self.defaults = dict(SITE_DEFAULTS)
+        self.defaults.update(defaults or {})
+        self.sites = []
+        self.by_name = {}
+        for entry in entries:
+            unknown = set(entry) - set(Site._fields)
+            if unknown:
+                raise ValueError(f"Unknown keys for site {entry.get('name')}: {', '.join(sorted(unknown))}")
+            site = self.make_site(entry["name"], entry)
+            if site.name in self.by_name:
+                raise ValueError(f"Site {site.name} is listed more than once")
+            if not site.host:
+                raise ValueError(f"Site {site.name} has no host template")
+            self.sites.append(site)
+            self.by_name[site.name] = site
+        self.names = [site.name for site in self.sites]
+
+    def make_site(self, name, entry=None):
+        values = dict(self.defaults)
+        values.update(entry or {})
+        values["name"] = name
+        return Site(**{field: values[field] for field in Site._fields})
+
+    def lookup(self, name):
+        """The inventory entry for `name`; sites not in the file (e.g. benchmark sites) get the defaults."""
+        site = self.by_name.get(name)
+        return site if site is not None else self.make_site(name)
+
+    def collection_order(self):
+        """Names of the enabled sites, highest priority first and in file order otherwise."""
+        enabled = [site for site in self.sites if site.enabled]
+        return [site.name for site in sorted(enabled, key=lambda site: -site.priority)]
+
+
+# Loaded on first use by load_site_inventory()
+site_inventory = None
+
+
+def load_site_inventory():
+    """
+    Load the site inventory from the JSON file in the same directory as the
+    script (once per run). The file holds a "defaults" block and a "sites" list:
+      {"defaults": {"host": "http://{site}-maracoos.dyndns.org:8240", ...},
+       "sites": [{"name": "NANT", "group": "5MHz"},
+                 {"name": "HOOK", "group": "5MHz", "details_timeout": 30, "enabled": false}, ...]}
+    Any key of SITE_DEFAULTS can be given per site or in "defaults".
+    """
+    global site_inventory
+    if site_inventory is not None:
+        return site_inventory
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    inventory_path = os.path.join(script_dir, SITE_INVENTORY_FILE)
+    try:
+        with open(inventory_path, 'r') as f:
+            inventory = json.load(f)
+        site_inventory = SiteInventory(inventory.get("defaults"), inventory["sites"])
+    except FileNotFoundError:
+        print(f"Error: Site inventory '{SITE_INVENTORY_FILE}' not found in {script_dir}")
+        sys.exit(1)
+    except json.JSONDecodeError as e:
+        print(f"Error: Invalid JSON in site inventory: {e}")
+        sys.exit(1)
+    except (KeyError, TypeError, ValueError) as e:
+        print(f"Error: Invalid site inventory: {e}")
+        sys.exit(1)
+    return site_inventory
+
+
+def site_url(site, path=""):
+    """Return the base URL of a site's Radial Suite web server, plus optional `path`."""
+    if rws_url_template:
+        return rws_url_template.format(site=site) + path
+    return load_site_inventory().lookup(site).host.format(site=site) + path
+
+def load_credentials(path=None):
     """
-    Load credentials from the JSON file in the same directory as the script.
+    Load credentials from the JSON file in the same directory as the script
+    (or from `path`).
     Returns (username, password_dict) or raises an exception if the file is not found or invalid.
     """
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    credentials_path = os.path.join(script_dir, CREDENTIALS_FILE)
+    credentials_path = path or os.path.join(script_dir, CREDENTIALS_FILE)
     
     try:
         with open(credentials_path, 'r') as f:
@@ -80,7 +315,7 @@ def load_credentials():
         return credentials['username'], credentials['passwords']
     
     except FileNotFoundError:
-        print(f"Error: Credentials file '{CREDENTIALS_FILE}' not found in {script_dir}")
+        print(f"Error: Credentials file '{credentials_path}' not found")
         print(f"Please create a credentials.json file with the following structure:")
         print("""{
     "username": "your_username",
@@ -101,11 +336,20 @@ def load_credentials():
         sys.exit(1)
 
 
-from selenium.webdriver.chrome.service import Service  # Import Service
-
-def create_webdriver(headless=True):
-    """Create and return a Selenium WebDriver with (optional) headless mode."""
+def create_webdriver(headless=True, lean=None):
+    """
+    Create and return a Selenium WebDriver with (optional) headless mode.
+    In lean mode (default: LEAN_MODE) pages load with the "eager" strategy and
+    images, fonts and stylesheets are blocked by URL pattern over the DevTools
+    protocol (images also through Chrome's content settings), since neither
+    the login nor the storage extraction needs them.
+    """
+    from selenium import webdriver
     from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+
+    lean = LEAN_MODE if lean is None else lean
+    print("Spinning up WebDriver..." + (" (lean mode)" if lean else ""))
     chrome_options = Options()
     if headless:
         chrome_options.add_argument("--headless")
@@ -113,110 +357,564 @@ def create_webdriver(headless=True):
     chrome_options.add_argument("--no-sandbox")
     chrome_options.add_argument("--disable-dev-shm-usage")
     chrome_options.add_argument("--disable-gpu")
+    if lean:
+        # Return control once the DOM is ready instead of waiting for every subresource
+        chrome_options.page_load_strategy = 'eager'
+        chrome_options.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+        })
 
     # Create a Service object using the path to the driver
     service = Service(executable_path=CHROME_DRIVER_PATH)
     
     # Use both service and options parameters
     driver = webdriver.Chrome(service=service, options=chrome_options)
-    driver.set_page_load_timeout(25)
+    driver.set_page_load_timeout(load_site_inventory().defaults["page_load_timeout"])
+    if lean:
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": LEAN_BLOCKED_URLS})
+        except Exception as e:
+            print(f"Warning: Could not enable request blocking: {e}")
     return driver
 
+
+# Reads the Navigation/Resource Timing entries of the current document
+PAGE_STATS_SCRIPT = """
+const nav = performance.getEntriesByType('navigation')[0] || {};
+const resources = performance.getEntriesByType('resource');
+let bytes = nav.transferSize || 0;
+for (const r of resources) { bytes += r.transferSize || 0; }
+const loaded = nav.loadEventEnd > 0 ? nav.loadEventEnd : (nav.domContentLoadedEventEnd || nav.duration || 0);
+return {bytes: bytes, load_ms: loaded, resources: resources.length};
+"""
+
+# Bytes transferred and load time per page: site, page, bytes, load_ms, resources, lean
+page_stats = []
+
+
+def record_page_stats(driver, site, page):
+    """Record how many bytes the current page pulled and how long it took to load."""
+    try:
+        stats = driver.execute_script(PAGE_STATS_SCRIPT)
+    except Exception as e:
+        if DEBUG_MODE:
+            print(f"[{site}] Could not read page timing for {page}: {e}")
+        return
+    record = {"site": site, "page": page, "bytes": int(stats.get("bytes") or 0),
+              "load_ms": round(float(stats.get("load_ms") or 0), 1),
+              "resources": int(stats.get("resources") or 0), "lean": LEAN_MODE}
+    page_stats.append(record)
+    if DEBUG_MODE:
+        print(f"[{site}] {page} page: {record['bytes'] / 1024:.1f} KB in {record['load_ms']:.0f} ms "
+              f"({record['resources']} subresources)")
+
+######################
+# Browser lifecycle
+######################
+
+# Browser memory and recycling counters for the current run
+driver_stats = {"peak_rss_mb": 0.0, "recycles": 0, "tabs_closed": 0}
+driver_stats_lock = threading.Lock()
+
+
+def process_tree_rss_mb(root_pid, exclude=()):
+    """
+    Resident memory of `root_pid` and all of its descendants, in MB, leaving out
+    the subtrees of the pids in `exclude`. Uses `ps`, so it works the same on
+    macOS and Linux.
+    """
+    try:
+        out = subprocess.run(["ps", "-A", "-o", "pid=,ppid=,rss="],
+                             capture_output=True, text=True, timeout=5).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    children = {}
+    rss_kb = {}
+    for line in out.splitlines():
+        fields = line.split()
+        if len(fields) != 3:
+            continue
+        pid, ppid, rss = (int(f) for f in fields)
+        children.setdefault(ppid, []).append(pid)
+        rss_kb[pid] = rss
+    total = 0
+    stack = [root_pid]
+    while stack:
+        pid = stack.pop()
+        if pid in exclude:
+            continue
+        total += rss_kb.get(pid, 0)
+        stack.extend(children.get(pid, []))
+    return total / 1024
+
+
+def browser_rss_mb(driver):
+    """Resident memory of a WebDriver's chromedriver and Chrome processes, in MB."""
+    try:
+        return process_tree_rss_mb(driver.service.process.pid)
+    except AttributeError:
+        return None
+
+
+def close_extra_tabs(driver, keep=()):
+    """
+    Close every tab except the first one and those in `keep`; returns how many
+    were closed. Leaves the driver switched to a surviving tab.
+    """
+    handles = driver.window_handles
+    survivors = [handles[0]] + [h for h in handles[1:] if h in keep]
+    closed = 0
+    for handle in handles:
+        if handle not in survivors:
+            driver.switch_to.window(handle)
+            driver.close()
+            closed += 1
+    driver.switch_to.window(survivors[-1])
+    return closed
+
+
+def python_peak_rss_mb():
+    """Peak resident memory of this Python process, in MB."""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class DriverManager:
+    """
+    Owns one WebDriver for its whole life cycle: creates it on demand, closes
+    tabs leaked by a site, samples the browser's memory after every site, and
+    restarts the browser after DRIVER_RECYCLE_SITES sites (in --watch mode,
+    sites that needed a new tab) or once it grows past DRIVER_MAX_RSS_MB.
+    Logged-in sessions survive a restart through the session cache.
+    """
+
+    def __init__(self, headless=True, recycle_after=None, max_rss_mb=None):
+        self.headless = headless
+        self.recycle_after = DRIVER_RECYCLE_SITES if recycle_after is None else recycle_after
+        self.max_rss_mb = DRIVER_MAX_RSS_MB if max_rss_mb is None else max_rss_mb
+        self.driver = None
+        self.sites_served = 0
+
+    def get(self):
+        if self.driver is None:
+            self.driver = create_webdriver(headless=self.headless)
+            self.sites_served = 0
+        return self.driver
+
+    def site_done(self, keep_tabs=(), new_tab=True):
+        """
+        Housekeeping after a site: close leaked tabs, check memory, maybe recycle.
+        A poll that reused a kept tab passes `new_tab=False` so it does not count
+        towards DRIVER_RECYCLE_SITES.
+        """
+        if self.driver is None:
+            return
+        if new_tab:
+            self.sites_served += 1
+        try:
+            closed = close_extra_tabs(self.driver, keep_tabs)
+        except Exception:
+            closed = 0
+        rss = browser_rss_mb(self.driver)
+        with driver_stats_lock:
+            driver_stats["tabs_closed"] += closed
+            if rss is not None:
+                driver_stats["peak_rss_mb"] = max(driver_stats["peak_rss_mb"], rss)
+        if DEBUG_MODE and rss is not None:
+            print(f"Browser RSS {rss:.0f} MB after {self.sites_served} sites ({closed} leaked tabs closed)")
+
+        if self.recycle_after and self.sites_served >= self.recycle_after:
+            self.recycle(f"served {self.sites_served} sites")
+        elif self.max_rss_mb and rss is not None and rss > self.max_rss_mb:
+            self.recycle(f"browser RSS {rss:.0f} MB over {self.max_rss_mb} MB")
+
+    def recycle(self, reason):
+        print(f"Recycling WebDriver ({reason})")
+        self.quit()
+        with driver_stats_lock:
+            driver_stats["recycles"] += 1
+
+    def quit(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception:
+                pass
+            self.driver = None
+
+
+######################
+# Timing instrumentation
+######################
+
+# One record per timed phase: site, phase, seconds, status (ok/timeout/error/failed), error class
+phase_timings = []
+# Sites with a timed-out phase among phase_timings (cleared along with it)
+timed_out_sites = set()
+
+
+@contextmanager
+def timed_phase(site, phase):
+    """
+    Time a collection phase for `site` and add it to phase_timings. Exceptions
+    are recorded (timeouts as "timeout", anything else as "error", with the
+    exception class) and re-raised. The yielded dict can be marked
+    {"status": "failed"} for failures that do not raise.
+    """
+    record = {"site": site, "phase": phase, "status": "ok", "error": None}
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        # Matched by name so Selenium need not be imported for HTTP-only runs;
+        # this also covers socket/asyncio TimeoutError
+        record["status"] = "timeout" if "Timeout" in e.__class__.__name__ else "error"
+        record["error"] = e.__class__.__name__
+        raise
+    finally:
+        record["seconds"] = round(time.perf_counter() - start, 4)
+        phase_timings.append(record)
+        if record["status"] == "timeout":
+            timed_out_sites.add(site)
+
+
+def site_timed_out(site):
+    """True if any phase for `site` recorded since the last export timed out."""
+    return site in timed_out_sites
+
+
+def prometheus_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def export_timings(run_ts, metrics_dir=None):
+    """
+    Write this run's phase timings and page load stats as JSON lines (appended
+    to TIMINGS_JSONL_FILE) and as a Prometheus textfile-collector file
+    (replaced atomically).
+    """
+    metrics_dir = metrics_dir or METRICS_PATH
+    os.makedirs(metrics_dir, exist_ok=True)
+    run_id = datetime.fromtimestamp(run_ts).strftime("%Y%m%d_%H%M%S")
+
+    with open(os.path.join(metrics_dir, TIMINGS_JSONL_FILE), "a") as f:
+        for record in phase_timings:
+            f.write(json.dumps(dict(record, run=run_id, ts=run_ts)) + "\n")
+        for record in page_stats:
+            f.write(json.dumps(dict(record, run=run_id, ts=run_ts)) + "\n")
+
+    # Phases can repeat (e.g. a page re-load), so sum them per site and phase
+    seconds = {}
+    errors = {}
+    for record in phase_timings:
+        key = (record["site"], record["phase"])
+        seconds[key] = seconds.get(key, 0.0) + record["seconds"]
+        if record["status"] != "ok":
+            error_key = key + (record["status"], record["error"] or "")
+            errors[error_key] = errors.get(error_key, 0) + 1
+
+    lines = [
+        "# HELP maracoos_collector_phase_seconds Time spent in each collection phase during the last run.",
+        "# TYPE maracoos_collector_phase_seconds gauge",
+    ]
+    for (site, phase), value in sorted(seconds.items()):
+        lines.append(f'maracoos_collector_phase_seconds{{site="{prometheus_label(site)}",'
+                     f'phase="{prometheus_label(phase)}"}} {value:.4f}')
+    lines += [
+        "# HELP maracoos_collector_phase_failures Failed phases (timeouts, errors) during the last run.",
+        "# TYPE maracoos_collector_phase_failures gauge",
+    ]
+    for (site, phase, status, error), count in sorted(errors.items()):
+        lines.append(f'maracoos_collector_phase_failures{{site="{prometheus_label(site)}",'
+                     f'phase="{prometheus_label(phase)}",status="{status}",'
+                     f'error="{prometheus_label(error)}"}} {count}')
+    # A page can be loaded more than once (e.g. /details again after a re-login),
+    # and Prometheus rejects repeated samples, so sum them per site, page and mode
+    page_totals = {}
+    for record in page_stats:
+        key = (record["site"], record["page"], record["lean"])
+        total = page_totals.setdefault(key, {"bytes": 0, "load_ms": 0.0})
+        total["bytes"] += record["bytes"]
+        total["load_ms"] += record["load_ms"]
+    if page_totals:
+        lines += [
+            "# HELP maracoos_collector_page_bytes Bytes transferred for each page during the last run.",
+            "# TYPE maracoos_collector_page_bytes gauge",
+        ]
+        for (site, page, lean), total in sorted(page_totals.items()):
+            lines.append(f'maracoos_collector_page_bytes{{site="{prometheus_label(site)}",'
+                         f'page="{page}",lean="{str(lean).lower()}"}} {total["bytes"]}')
+        lines += [
+            "# HELP maracoos_collector_page_load_seconds Load time of each page during the last run.",
+            "# TYPE maracoos_collector_page_load_seconds gauge",
+        ]
+        for (site, page, lean), total in sorted(page_totals.items()):
+            lines.append(f'maracoos_collector_page_load_seconds{{site="{prometheus_label(site)}",'
+                         f'page="{page}",lean="{str(lean).lower()}"}} {total["load_ms"] / 1000:.3f}')
+    lines += [
+        "# HELP maracoos_collector_browser_peak_rss_bytes Peak resident memory of Chrome during the last run.",
+        "# TYPE maracoos_collector_browser_peak_rss_bytes gauge",
+        f"maracoos_collector_browser_peak_rss_bytes {driver_stats['peak_rss_mb'] * 1024 * 1024:.0f}",
+        "# HELP maracoos_collector_browser_recycles WebDriver restarts during the last run.",
+        "# TYPE maracoos_collector_browser_recycles gauge",
+        f"maracoos_collector_browser_recycles {driver_stats['recycles']}",
+    ]
+    lines += [
+        "# HELP maracoos_collector_last_run_timestamp_seconds Start time of the last collection run.",
+        "# TYPE maracoos_collector_last_run_timestamp_seconds gauge",
+        f"maracoos_collector_last_run_timestamp_seconds {run_ts:.0f}",
+    ]
+
+    prom_path = shard_file(os.path.join(metrics_dir, PROMETHEUS_FILE))
+    tmp_path = prom_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, prom_path)
+    return prom_path
+
+
+######################
+# Session cache
+######################
+
+# Consolidated cookie cache: {site: {"cookies": [...], "expires": epoch or None,
+# "validated": epoch}}. Loaded once per run; changes are written back at most
+# every SESSION_SAVE_INTERVAL seconds and at exit.
+session_cache = None
+session_lock = threading.Lock()
+session_stats = {"hit": 0, "miss": 0, "expired": 0}
+session_dirty = False
+session_saved_at = 0.0
+
+
+def session_cache_path():
+    return shard_file(os.path.join(COOKIE_PATH, SESSION_CACHE_FILE))
+
+
+def load_session_cache():
+    """
+    Load the session cache from disk (once per run), importing any legacy
+    per-site `<SITE>cookies.pkl` files that are not in it yet.
+    """
+    global session_cache, session_dirty
+    import atexit
+    with session_lock:
+        if session_cache is not None:
+            return session_cache
+        try:
+            with open(session_cache_path(), "r") as f:
+                session_cache = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            session_cache = {}
+
+        for cookie_file in glob.glob(f"{COOKIE_PATH}/*cookies.pkl"):
+            site = os.path.basename(cookie_file)[:-len("cookies.pkl")]
+            if site not in session_cache:
+                try:
+                    with open(cookie_file, "rb") as file:
+                        cookies = pickle.load(file)
+                    session_cache[site] = {"cookies": cookies, "expires": cookie_list_expiry(cookies),
+                                           "validated": os.path.getmtime(cookie_file)}
+                    session_dirty = True
+                except (pickle.UnpicklingError, EOFError, OSError):
+                    pass
+            os.remove(cookie_file)
+        atexit.register(flush_session_cache)
+        return session_cache
+
+
+def save_session_cache(force=False):
+    """
+    Atomically write the session cache back to disk, unless it was written less
+    than SESSION_SAVE_INTERVAL seconds ago and not `force`; the change is then
+    left for the next save or flush_session_cache. Rewriting the whole file on
+    every login was quadratic in the number of sites. Caller holds session_lock.
+    """
+    global session_dirty, session_saved_at
+    session_dirty = True
+    if not force and time.time() - session_saved_at < SESSION_SAVE_INTERVAL:
+        return
+    os.makedirs(COOKIE_PATH, exist_ok=True)
+    tmp_path = session_cache_path() + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(session_cache, f)
+    os.replace(tmp_path, session_cache_path())
+    session_dirty = False
+    session_saved_at = time.time()
+
+
+def flush_session_cache():
+    """Write any session cache changes still pending (registered to run at exit)."""
+    with session_lock:
+        if session_dirty and session_cache is not None:
+            save_session_cache(force=True)
+
+
+def cookie_list_expiry(cookies):
+    """Earliest 'expiry' among Selenium-style cookie dicts, or None if all are session cookies."""
+    expiries = [c["expiry"] for c in cookies if c.get("expiry") is not None]
+    return min(expiries) if expiries else None
+
+
+def get_cached_session(site):
+    """
+    Return the cached cookies for `site`, or None if there are none or they are
+    known to be stale (a cookie has expired, or the session has not been
+    validated within SESSION_MAX_AGE_HOURS). Stale entries are dropped here,
+    without a round trip to the site.
+    """
+    cache = load_session_cache()
+    now = time.time()
+    with session_lock:
+        entry = cache.get(site)
+        if not entry or not entry.get("cookies"):
+            session_stats["miss"] += 1
+            return None
+        expires = entry.get("expires")
+        validated = entry.get("validated") or 0
+        if (expires is not None and expires <= now) or now - validated > SESSION_MAX_AGE_HOURS * 3600:
+            session_stats["expired"] += 1
+            del cache[site]
+            save_session_cache()
+            if DEBUG_MODE:
+                print(f"[{site}] Cached session is stale; dropped")
+            return None
+        session_stats["hit"] += 1
+        return entry["cookies"]
+
+
+def store_session(site, cookies):
+    """Cache a freshly logged-in session's cookies along with their expiry."""
+    cache = load_session_cache()
+    with session_lock:
+        cache[site] = {"cookies": cookies, "expires": cookie_list_expiry(cookies), "validated": time.time()}
+        save_session_cache()
+
+
+def mark_session_validated(site):
+    """Record that the cached session for `site` was just accepted by the site."""
+    cache = load_session_cache()
+    with session_lock:
+        if site in cache:
+            cache[site]["validated"] = time.time()
+            save_session_cache()
+
+
+def drop_session(site):
+    """Forget the cached session for `site`."""
+    cache = load_session_cache()
+    with session_lock:
+        if cache.pop(site, None) is not None:
+            save_session_cache()
+
+
 def login_and_navigate(driver, site, password):
     """
     Given a driver, site name, and password,
     attempt to load the site login page and sign in.
     Returns True if login is successful, False otherwise.
     """
-    full_url = f"{rws_link_prefix}{site}{rws_link_suffix}"
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.common.keys import Keys
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.common.exceptions import TimeoutException
+
+    full_url = site_url(site)
+    timeouts = load_site_inventory().lookup(site)
 
     # Open a new tab for each site (optional, you can also reuse the same tab)
-    driver.execute_script("window.open('');")
-    driver.switch_to.window(driver.window_handles[-1])
+    with timed_phase(site, "tab_open"):
+        driver.execute_script("window.open('');")
+        driver.switch_to.window(driver.window_handles[-1])
+        driver.set_page_load_timeout(timeouts.page_load_timeout)
 
     try:
-        driver.get(full_url)
+        with timed_phase(site, "initial_get"):
+            driver.get(full_url)
     except TimeoutException:
         print(f"Loading took too much time for {site}")
         return False
+    record_page_stats(driver, site, "login")
 
-    # Attempt cookie load with improved error handling
-    cookie_file_path = f"{COOKIE_PATH}/{site}cookies.pkl"
+    # Restore the cached session, if the cache still considers it fresh
     cookies_loaded = False
-    try:
-        with open(cookie_file_path, "rb") as file:
-            cookies = pickle.load(file)
-            for cookie in cookies:
-                try:
+    cookies = get_cached_session(site)
+    if cookies:
+        try:
+            with timed_phase(site, "cookie_load"):
+                for cookie in cookies:
                     driver.add_cookie(cookie)
-                except Exception as e:
-                    print(f"[{site}] Error adding cookie: {e}")
-                    # Delete corrupted cookie file and proceed with login
-                    if os.path.exists(cookie_file_path):
-                        os.remove(cookie_file_path)
-                        print(f"[{site}] Deleted corrupted cookie file")
-                    break
-            
+        except Exception as e:
+            print(f"[{site}] Error adding cookie: {e}")
+            # Drop the corrupted session and proceed with login
+            drop_session(site)
+            print(f"[{site}] Dropped corrupted cached session")
+        else:
             # Try to refresh with timeout handling
             try:
-                driver.refresh()
+                with timed_phase(site, "cookie_refresh"):
+                    driver.refresh()
                 cookies_loaded = True
-                time.sleep(3)  # small delay after refresh
+                record_page_stats(driver, site, "status")
             except TimeoutException:
                 print(f"[{site}] Timeout during page refresh after loading cookies. Proceeding with login.")
-                # Delete problematic cookies and continue
-                if os.path.exists(cookie_file_path):
-                    os.remove(cookie_file_path)
-                    print(f"[{site}] Deleted problematic cookie file")
+                drop_session(site)
                 # Reload the original page
                 try:
-                    driver.get(full_url)
+                    with timed_phase(site, "initial_get"):
+                        driver.get(full_url)
                 except TimeoutException:
                     print(f"[{site}] Timeout reloading page after cookie refresh failure")
                     return False
-                    
-    except (FileNotFoundError, pickle.UnpicklingError, EOFError) as e:
-        if DEBUG_MODE:
-            print(f"[{site}] Cookie file issue: {e}. Will login with credentials.")
-        pass
 
     # Check if we're already logged in by looking for /status or a known element
     # If not logged in, proceed with credentials
     try:
-        # Wait for the login elements to appear or the site to redirect
-        WebDriverWait(driver, 5).until(EC.presence_of_element_located((By.NAME, "login_username")))
+        # Wait for the login elements to appear or the site to land on /status,
+        # whichever comes first, instead of sleeping a fixed time after refresh
+        with timed_phase(site, "login_wait"):
+            WebDriverWait(driver, timeouts.login_wait).until(EC.any_of(
+                EC.presence_of_element_located((By.NAME, "login_username")),
+                EC.url_contains("/status")))
+        if not driver.find_elements(By.NAME, 'login_username'):
+            if DEBUG_MODE:
+                print(f"[{site}] Cached session still valid (URL: {driver.current_url})")
+            if cookies_loaded:
+                mark_session_validated(site)
+            return True
         # If we do see the login fields, fill them in
-        username_field = driver.find_element(By.NAME, 'login_username')
-        username_field.send_keys(username)
-        password_field = driver.find_element(By.NAME, 'login_password')
-        password_field.send_keys(password)
-        password_field.send_keys(Keys.RETURN)
-        
-        # Wait for redirect with better error handling
-        try:
-            WebDriverWait(driver, 15).until(EC.url_contains("/status"))
-            print(f"[{site}] Logged in successfully.")
-        except TimeoutException:
-            # Check if we're on a different page that indicates successful login
-            current_url = driver.current_url
-            if "login" not in current_url.lower():
-                print(f"[{site}] Login appears successful (redirected to: {current_url})")
-            else:
-                print(f"[{site}] Login may have failed - still on login page")
-                return False
+        with timed_phase(site, "login_submit") as phase:
+            username_field = driver.find_element(By.NAME, 'login_username')
+            username_field.send_keys(username)
+            password_field = driver.find_element(By.NAME, 'login_password')
+            password_field.send_keys(password)
+            password_field.send_keys(Keys.RETURN)
 
-        # Save new cookies only if login was successful
-        if not cookies_loaded:  # Only save if we didn't use existing cookies
+            # Wait for redirect with better error handling
             try:
-                cookies = driver.get_cookies()
-                # Ensure cookie directory exists
-                os.makedirs(COOKIE_PATH, exist_ok=True)
-                with open(cookie_file_path, "wb") as file:
-                    pickle.dump(cookies, file)
-                if DEBUG_MODE:
-                    print(f"[{site}] Saved new cookies")
-            except Exception as e:
-                print(f"[{site}] Warning: Could not save cookies: {e}")
+                WebDriverWait(driver, timeouts.login_timeout).until(EC.url_contains("/status"))
+                print(f"[{site}] Logged in successfully.")
+            except TimeoutException:
+                # Check if we're on a different page that indicates successful login
+                current_url = driver.current_url
+                if "login" not in current_url.lower():
+                    print(f"[{site}] Login appears successful (redirected to: {current_url})")
+                else:
+                    print(f"[{site}] Login may have failed - still on login page")
+                    phase["status"] = "failed"
+                    return False
+
+        # Save the new session only if login was successful
+        try:
+            store_session(site, driver.get_cookies())
+            if DEBUG_MODE:
+                print(f"[{site}] Saved new cookies")
+        except Exception as e:
+            print(f"[{site}] Warning: Could not save cookies: {e}")
 
     except TimeoutException:
         # Possibly we are already logged in or the site didn't need login
@@ -241,82 +939,139 @@ def get_storage_info(driver, site):
     (internal_free, external_free) as integer percentages.
     Updated to handle new Codar Radial Suite format.
     """
-    full_url = f"{rws_link_prefix}{site}{rws_link_suffix}/details"
+    from selenium.common.exceptions import TimeoutException
+
+    full_url = site_url(site, "/details")
+    timeouts = load_site_inventory().lookup(site)
 
     try:
         # Set a shorter timeout for the details page
-        driver.set_page_load_timeout(15)
-        driver.get(full_url)
+        driver.set_page_load_timeout(timeouts.details_timeout)
+        with timed_phase(site, "details_load"):
+            driver.get(full_url)
         # Reset timeout back to default
-        driver.set_page_load_timeout(25)
+        driver.set_page_load_timeout(timeouts.page_load_timeout)
+        record_page_stats(driver, site, "details")
     except TimeoutException:
         print(f"[{site}] Timeout loading details page.")
-        driver.set_page_load_timeout(25)  # Reset timeout
+        driver.set_page_load_timeout(timeouts.page_load_timeout)  # Reset timeout
         return (None, None)
 
-    internal_free = None
-    external_free = None
-
+    # Pull the whole page once and parse it in-process instead of issuing a
+    # WebDriver round trip for every notice block and XPath lookup
     try:
-        # First, try to find storage info in notice blocks anywhere on the page
-        notice_blocks = driver.find_elements(By.XPATH, "//div[contains(@class, 'notice')]")
-        
-        if DEBUG_MODE:
-            print(f"[{site}] Found {len(notice_blocks)} notice blocks:")
-        
-        storage_blocks = []
-        for i, block in enumerate(notice_blocks):
-            text = block.text
-            if DEBUG_MODE:
-                print(f"  Block {i}: {text[:100]}...")
-            
-            # Look for patterns indicating storage information
-            if any(keyword in text.lower() for keyword in ['avail.', 'available', 'gb', 'free', 'used']):
-                if any(keyword in text.lower() for keyword in ['volume', 'boot', 'disk', 'storage', 'codar']):
-                    storage_blocks.append(text)
-        
-        if DEBUG_MODE:
-            print(f"[{site}] Found {len(storage_blocks)} storage-related blocks")
-        
-        # Parse storage blocks
-        if len(storage_blocks) > 0:
-            internal_free = parse_free_percentage(storage_blocks[0])
-            if DEBUG_MODE:
-                print(f"[{site}] Internal storage: {internal_free}% from '{storage_blocks[0][:50]}...'")
-                
-        if len(storage_blocks) > 1:
-            external_free = parse_free_percentage(storage_blocks[1])
-            if DEBUG_MODE:
-                print(f"[{site}] External storage: {external_free}% from '{storage_blocks[1][:50]}...'")
-        
-        # If we didn't find storage blocks in notices, try the original Processor approach
-        if internal_free is None:
-            try:
-                processor_div = driver.find_element(By.XPATH, "//div[contains(@class, 'collapse_tab') and contains(text(), 'Processor')]")
-                repsection = processor_div.find_element(By.XPATH, "following-sibling::div[contains(@class, 'repsection')]")
-                processor_notices = repsection.find_elements(By.XPATH, ".//div[contains(@class, 'notice')]")
-                
-                if len(processor_notices) > 0:
-                    internal_free = parse_free_percentage(processor_notices[0].text)
-                if len(processor_notices) > 1:
-                    external_free = parse_free_percentage(processor_notices[1].text)
-                    
-                if DEBUG_MODE:
-                    print(f"[{site}] Found storage in Processor section: internal={internal_free}%, external={external_free}%")
-                    
-            except NoSuchElementException:
-                if DEBUG_MODE:
-                    print(f"[{site}] Processor section not found")
-                pass
-
-    except NoSuchElementException:
-        print(f"[{site}] No storage information found on page.")
+        with timed_phase(site, "page_source"):
+            html = driver.page_source
+    except Exception as e:
+        print(f"[{site}] Error reading details page: {e}")
         return (None, None)
+    archive_page(site, html)
+
+    stats = {}
+    try:
+        with timed_phase(site, "parse"):
+            storage = extract_storage_from_dom(parse_html(html), site, stats)
     except Exception as e:
         print(f"[{site}] Error parsing storage info: {e}")
         return (None, None)
 
-    return (internal_free, external_free)
+    # What the element-by-element approach would have cost: one find_elements plus
+    # a .text per notice, and three lookups plus a .text per Processor notice
+    legacy_rpcs = 1 + stats["notice_blocks"]
+    if stats["processor_notices"] is not None:
+        legacy_rpcs += 3 + stats["processor_notices"]
+    rpc_savings[site] = legacy_rpcs - 1
+    if DEBUG_MODE:
+        print(f"[{site}] Single page_source parse saved {rpc_savings[site]} WebDriver calls")
+
+    return storage
+
+
+STORAGE_VALUE_KEYWORDS = ('avail.', 'available', 'gb', 'free', 'used')
+STORAGE_VOLUME_KEYWORDS = ('volume', 'boot', 'disk', 'storage', 'codar')
+
+def is_storage_block(text):
+    """Return True if a notice block's text looks like a storage/volume report."""
+    lowered = text.lower()
+    if any(keyword in lowered for keyword in STORAGE_VALUE_KEYWORDS):
+        if any(keyword in lowered for keyword in STORAGE_VOLUME_KEYWORDS):
+            return True
+    return False
+
+
+# One pattern for every volume format the Radial Suite pages have used. The first
+# branch is an "X GB available out of Y GB" statement with an optional
+# "[NN% avail.]" tail; the second is a bare "NN% avail./available/free/used".
+VOLUME_PATTERN = re.compile(
+    r"(?=[\d\[])(?:(?P<avail_gb>\d+\.?\d*)\s*gb\s*available\s*out\s*of\s*(?P<total_gb>\d+\.?\d*)\s*gb"
+    r"(?:\s*(?P<gb_open>\[)?(?P<gb_pct>\d+)%\s*(?P<gb_kind>avail\.|available)(?P<gb_close>\])?)?"
+    r"|(?P<open>\[)?(?P<pct>\d+)%\s*(?P<kind>avail\.|available|free|used)(?P<close>\])?)",
+    re.IGNORECASE)
+
+# Characters that end the previous statement when looking back for a volume name
+VOLUME_NAME_DELIMITERS = re.compile(r"[^\w\-/ ]")
+
+# Order in which formats are trusted when a block reports more than one value
+FORMAT_PRIORITY = {'bracket': 0, 'avail.': 1, 'available': 2, 'free': 3, 'used': 4, 'gb': 5}
+
+
+class VolumeRecord(namedtuple('VolumeRecord', ['name', 'available_gb', 'total_gb', 'percent', 'format'])):
+    """
+    One volume parsed from a notice block. `available_gb`/`total_gb` are None when
+    the block only reports a percentage; `percent` is free space as an integer;
+    `format` is one of FORMAT_PRIORITY's keys. Only `percent` is stored and
+    forecast (through parse_free_percentage): many blocks carry no GB figures.
+    """
+    __slots__ = ()
+
+
+def volume_name_before(text_block, end):
+    """Return the "<name>" of a "<name> has ..." statement ending at `end`, or None."""
+    prefix = text_block[max(0, end - 80):end].rstrip()
+    if not prefix.lower().endswith(' has'):
+        return None
+    prefix = prefix[:-4]
+    # Keep only the words after the last punctuation/newline
+    parts = VOLUME_NAME_DELIMITERS.split(prefix)
+    name = parts[-1].strip() if parts else ''
+    return name or None
+
+
+def parse_volumes(text_block):
+    """
+    Return a VolumeRecord for every volume reported in `text_block`, in the
+    order they appear, using a single pass of VOLUME_PATTERN.
+    """
+    if not text_block:
+        return []
+
+    records = []
+    for m in VOLUME_PATTERN.finditer(text_block):
+        avail_gb, total_gb, gb_open, gb_pct, gb_kind, gb_close, open_, pct, kind, close = m.groups()
+        if avail_gb is not None:
+            available = float(avail_gb)
+            total = float(total_gb)
+            if gb_pct is not None:
+                percent = int(gb_pct)
+                fmt = gb_kind.lower()
+                if fmt == 'avail.' and gb_open and gb_close:
+                    fmt = 'bracket'
+            elif total > 0:
+                percent = int((available / total) * 100)
+                fmt = 'gb'
+            else:
+                continue
+            records.append(VolumeRecord(volume_name_before(text_block, m.start()),
+                                        available, total, percent, fmt))
+        else:
+            kind = kind.lower()
+            percent = int(pct)
+            if kind == 'used':
+                percent = 100 - percent
+            elif kind == 'avail.' and open_ and close:
+                kind = 'bracket'
+            records.append(VolumeRecord(None, None, None, percent, kind))
+    return records
 
 
 def parse_free_percentage(text_block):
@@ -325,244 +1080,2655 @@ def parse_free_percentage(text_block):
     - "Boot Volume has 476.47 GB available out of 1000.24 GB [48% avail.]"
     - "XX% free" or "XX% used" patterns
     Returns an integer free-space percentage or None if parsing fails.
+    Thin wrapper over parse_volumes that keeps the most trusted format.
     """
-    if not text_block:
-        return None
-    
-    # Look for [XX% avail.] pattern (new format)
-    match_bracket = re.search(r'\[(\d+)\%\s*avail\.\]', text_block, re.IGNORECASE)
-    if match_bracket:
-        return int(match_bracket.group(1))
-    
-    # Look for "XX% avail." pattern
-    match_avail = re.search(r'(\d+)\%\s*avail\.', text_block, re.IGNORECASE)
-    if match_avail:
-        return int(match_avail.group(1))
-    
-    # Look for "XX% available" pattern
-    match_available = re.search(r'(\d+)\%\s*available', text_block, re.IGNORECASE)
-    if match_available:
-        return int(match_available.group(1))
-    
-    # Look for "XX% free" pattern
-    match_free = re.search(r'(\d+)\%\s*free', text_block, re.IGNORECASE)
-    if match_free:
-        return int(match_free.group(1))
-
-    # Look for "XX% used" pattern and convert
-    match_used = re.search(r'(\d+)\%\s*used', text_block, re.IGNORECASE)
-    if match_used:
-        used_val = int(match_used.group(1))
-        return 100 - used_val
-    
-    # Try to extract from "X.XX GB available out of Y.YY GB" format
-    match_gb = re.search(r'(\d+\.?\d*)\s*gb\s*available\s*out\s*of\s*(\d+\.?\d*)\s*gb', text_block, re.IGNORECASE)
-    if match_gb:
-        available = float(match_gb.group(1))
-        total = float(match_gb.group(2))
-        if total > 0:
-            percentage = int((available / total) * 100)
-            return percentage
+    best = None
+    for record in parse_volumes(text_block):
+        if best is None or FORMAT_PRIORITY[record.format] < FORMAT_PRIORITY[best.format]:
+            best = record
+    if best is not None:
+        return best.percent
 
-    if DEBUG_MODE:
+    if DEBUG_MODE and text_block:
         print(f"Could not parse percentage from: '{text_block[:100]}...'")
-    
+
     return None
 
 
-def create_figure(results, output_path):
-    """
-    Takes `results` (list of dicts with keys: site, internal_free, external_free),
-    creates a horizontal bar chart, and saves to `output_path`.
+# Tags that never have a closing tag, and tags whose text Selenium would not show
+_VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+              'link', 'meta', 'param', 'source', 'track', 'wbr'}
+_HIDDEN_TAGS = {'script', 'style', 'head', 'title', 'noscript', 'template'}
+_BLOCK_TAGS = {'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl',
+               'dt', 'fieldset', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+               'header', 'hr', 'li', 'main', 'nav', 'ol', 'p', 'pre', 'section',
+               'table', 'tr', 'ul'}
 
-    Features:
-    1. Leaves an empty space for sites that can't be accessed (i.e., missing data).
-    2. Colors each bar based on free-space percentage:
-       100–50: green, 50–35: yellow, 35–20: orange, 20–0: red.
-    3. Differentiates internal vs external storage using hatch patterns.
-    4. Moves the legend outside the plot to the top right.
-    5. Adds vertical padding between each site group while keeping the two bars for the same site contiguous.
-    6. Inserts an extra vertical gap between frequency groups.
-    """
-    import matplotlib.pyplot as plt
-    import numpy as np
-    from matplotlib.patches import Patch
-
-    def get_color(free_val):
-        if free_val >= 50:
-            return 'green'
-        elif free_val >= 35:
-            return 'yellow'
-        elif free_val >= 20:
-            return 'orange'
-        else:
-            return 'red'
-
-    # Define a mapping from site to frequency group.
-    frequency_mapping = {
-        'NANT': '5MHz', 'BLCK': '5MHz', 'AMAG': '5MHz', 'MRCH': '5MHz', 'HEMP': '5MHz',
-        'HOOK': '5MHz', 'LOVE': '5MHz', 'BRIG': '5MHz', 'WILD': '5MHz',
-        'SILD': '25MHz', 'OLDB': '25MHz', 'PORT': '25MHz', 'CAPE': '25MHz',
-        'CMPT': '25MHz', 'LEWE': '25MHz', 'HLPN': '25MHz',
-        'SEAB': '13MHz', 'BRAD': '13MHz', 'SPRK': '13MHz', 'HLGT': '13MHz',
-        'BRMR': '13MHz', 'RATH': '13MHz', 'WOOD': '13MHz'
-    }
 
-    current_time = time.strftime("%Y-%m-%d %H:%M:%S")
-    save_time = datetime.now().strftime("%Y%m%d_%H%M")
-    save_name = f"MARACOOS_Storage_Space_{save_time}.png"
-    full_output_path = f"{output_path}/{save_name}"
-    
-    # Ensure output directory exists
-    os.makedirs(output_path, exist_ok=True)
-    
+class HtmlNode:
+    """A minimal DOM element: tag name, attribute dict, and child nodes/strings."""
+    __slots__ = ('tag', 'attrs', 'children', 'parent')
+
+    def __init__(self, tag, attrs, parent=None):
+        self.tag = tag
+        self.attrs = attrs
+        self.children = []
+        self.parent = parent
+
+    def has_class(self, name):
+        # Same semantics as XPath contains(@class, name): a substring match
+        return name in (self.attrs.get('class') or '')
+
+    def iter(self, tag=None):
+        """Yield this node and all descendant elements in document order."""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if tag is None or node.tag == tag:
+                yield node
+            stack.extend(c for c in reversed(node.children) if isinstance(c, HtmlNode))
+
+    def direct_text(self):
+        """Concatenated text nodes that are immediate children of this element."""
+        return ''.join(c for c in self.children if isinstance(c, str))
+
+    def text(self):
+        """Approximate Selenium's element.text: visible text, one line per block element."""
+        parts = []
+        self._collect_text(parts)
+        lines = (' '.join(line.split()) for line in ''.join(parts).split('\n'))
+        return '\n'.join(line for line in lines if line)
+
+    def _collect_text(self, parts):
+        for child in self.children:
+            if isinstance(child, str):
+                parts.append(child.replace('\n', ' '))
+            elif child.tag not in _HIDDEN_TAGS:
+                if child.tag in _BLOCK_TAGS:
+                    parts.append('\n')
+                child._collect_text(parts)
+                if child.tag in _BLOCK_TAGS:
+                    parts.append('\n')
+
+
+class _DomBuilder(HTMLParser):
+    """Build an HtmlNode tree from (possibly sloppy) HTML using the stdlib parser."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = HtmlNode('#document', {})
+        self._current = self.root
+
+    def handle_starttag(self, tag, attrs):
+        node = HtmlNode(tag, {k: (v or '') for k, v in attrs}, self._current)
+        self._current.children.append(node)
+        if tag not in _VOID_TAGS:
+            self._current = node
+
+    def handle_startendtag(self, tag, attrs):
+        node = HtmlNode(tag, {k: (v or '') for k, v in attrs}, self._current)
+        self._current.children.append(node)
+
+    def handle_endtag(self, tag):
+        # Close the nearest open element with this tag; ignore stray end tags
+        node = self._current
+        while node is not None and node.tag != tag:
+            node = node.parent
+        if node is not None and node.parent is not None:
+            self._current = node.parent
+
+    def handle_data(self, data):
+        self._current.children.append(data)
+
+
+def parse_html(html):
+    """Parse an HTML string and return the root HtmlNode."""
+    builder = _DomBuilder()
+    builder.feed(html or '')
+    builder.close()
+    return builder.root
+
+
+def extract_storage_from_dom(root, site, stats=None):
+    """
+    Apply both storage strategies to a parsed details page: storage-looking
+    notice blocks anywhere on the page, then the notice blocks inside the
+    Processor repsection. Returns (internal_free, external_free).
+    If `stats` is a dict it receives the number of notice blocks seen and the
+    number of Processor notices read (None if that fallback was not used).
+    """
+    internal_free = None
+    external_free = None
+
+    notice_texts = [div.text() for div in root.iter('div') if div.has_class('notice')]
+    if DEBUG_MODE:
+        print(f"[{site}] Found {len(notice_texts)} notice blocks:")
+        for i, text in enumerate(notice_texts):
+            print(f"  Block {i}: {text[:100]}...")
+
+    storage_blocks = [text for text in notice_texts if is_storage_block(text)]
+    if DEBUG_MODE:
+        print(f"[{site}] Found {len(storage_blocks)} storage-related blocks")
+
+    if len(storage_blocks) > 0:
+        internal_free = parse_free_percentage(storage_blocks[0])
+        if DEBUG_MODE:
+            print(f"[{site}] Internal storage: {internal_free}% from '{storage_blocks[0][:50]}...'")
+    if len(storage_blocks) > 1:
+        external_free = parse_free_percentage(storage_blocks[1])
+        if DEBUG_MODE:
+            print(f"[{site}] External storage: {external_free}% from '{storage_blocks[1][:50]}...'")
+
+    processor_notices = None
+    # Fall back to the notice blocks under the Processor section
+    if internal_free is None:
+        processor_notices = find_processor_notices(root)
+        if processor_notices is None:
+            if DEBUG_MODE:
+                print(f"[{site}] Processor section not found")
+        else:
+            if len(processor_notices) > 0:
+                internal_free = parse_free_percentage(processor_notices[0])
+            if len(processor_notices) > 1:
+                external_free = parse_free_percentage(processor_notices[1])
+            if DEBUG_MODE:
+                print(f"[{site}] Found storage in Processor section: internal={internal_free}%, external={external_free}%")
+
+    if stats is not None:
+        stats["notice_blocks"] = len(notice_texts)
+        stats["processor_notices"] = len(processor_notices) if processor_notices is not None else None
+    return (internal_free, external_free)
+
+
+def find_processor_notices(root):
+    """
+    Return the texts of the notice blocks in the 'repsection' that follows the
+    'Processor' collapse_tab, or None if that section is not on the page.
+    """
+    for div in root.iter('div'):
+        if not (div.has_class('collapse_tab') and 'Processor' in div.direct_text()):
+            continue
+        siblings = div.parent.children
+        for sibling in siblings[siblings.index(div) + 1:]:
+            if isinstance(sibling, HtmlNode) and sibling.tag == 'div' and sibling.has_class('repsection'):
+                return [n.text() for n in sibling.iter('div') if n is not sibling and n.has_class('notice')]
+        return None
+    return None
+
+
+def extract_storage_from_html(html, site):
+    """Parse a details page's HTML and return (internal_free, external_free)."""
+    try:
+        return extract_storage_from_dom(parse_html(html), site)
+    except Exception as e:
+        print(f"[{site}] Error parsing storage info: {e}")
+        return (None, None)
+
+
+######################
+# HTTP backend (no browser)
+######################
+
+def http_request(conn_cache, method, url, cookies, data=None, timeout=25, max_redirects=5,
+                 cookie_expiry=None):
+    """
+    Issue a request on a kept-alive http.client connection and follow redirects.
+    `conn_cache` maps (scheme, netloc) to an open connection so that every request
+    for a site reuses one socket; `cookies` is a dict updated from Set-Cookie, and
+    `cookie_expiry` (if given) receives each cookie's expiry as epoch seconds.
+    Returns (final_url, status, body_text).
+    """
+    import http.client
+    from http.cookies import SimpleCookie
+
+    for _ in range(max_redirects + 1):
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        conn = conn_cache.get(key)
+        if conn is None:
+            conn_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+            conn = conn_class(parts.netloc, timeout=timeout)
+            conn_cache[key] = conn
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+
+        headers = {'User-Agent': 'MARACOOS-storage-monitor', 'Connection': 'keep-alive'}
+        if cookies:
+            headers['Cookie'] = '; '.join(f"{k}={v}" for k, v in cookies.items())
+        body = None
+        if data is not None:
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            resp = conn.getresponse()
+            payload = resp.read()
+        except (http.client.HTTPException, OSError):
+            # Drop the broken connection so the next attempt reconnects
+            conn.close()
+            conn_cache.pop(key, None)
+            raise
+
+        for header in resp.msg.get_all('Set-Cookie') or []:
+            jar = SimpleCookie()
+            jar.load(header)
+            for name, morsel in jar.items():
+                cookies[name] = morsel.value
+                if cookie_expiry is not None:
+                    cookie_expiry[name] = morsel_expiry(morsel)
+
+        if resp.status in (301, 302, 303, 307, 308) and resp.getheader('Location'):
+            url = urljoin(url, resp.getheader('Location'))
+            if resp.status in (301, 302, 303):
+                method, data = 'GET', None
+            continue
+
+        charset = resp.msg.get_content_charset() or 'utf-8'
+        return url, resp.status, payload.decode(charset, errors='replace')
+
+    raise http.client.HTTPException(f"Too many redirects for {url}")
+
+
+def morsel_expiry(morsel):
+    """Expiry of a Set-Cookie morsel as epoch seconds, or None for a session cookie."""
+    from email.utils import parsedate_to_datetime
+    try:
+        if morsel['max-age']:
+            return time.time() + int(morsel['max-age'])
+        if morsel['expires']:
+            return parsedate_to_datetime(morsel['expires']).timestamp()
+    except (ValueError, TypeError):
+        pass
+    return None
+
+
+def find_login_form(root, page_url):
+    """
+    Locate the form holding the login_username field. Returns (action_url, fields)
+    with any hidden inputs pre-filled, or None if the page has no login form.
+    """
+    for form in root.iter('form'):
+        inputs = list(form.iter('input'))
+        if any(i.attrs.get('name') == 'login_username' for i in inputs):
+            fields = {i.attrs['name']: i.attrs.get('value', '') for i in inputs
+                      if i.attrs.get('name') and i.attrs.get('type', '').lower() == 'hidden'}
+            return urljoin(page_url, form.attrs.get('action') or page_url), fields
+    # Some pages place the inputs outside a <form>; post back to the same URL
+    for node in root.iter('input'):
+        if node.attrs.get('name') == 'login_username':
+            return page_url, {}
+    return None
+
+
+def load_http_cookies(site):
+    """Return the cached session cookies for `site` as a simple name -> value dict."""
+    return {c['name']: c['value'] for c in get_cached_session(site) or []}
+
+
+def save_http_cookies(site, cookies, expiry=None):
+    """Store `cookies` in the session cache in the list-of-dicts format Selenium uses."""
+    host = urlsplit(site_url(site)).hostname
+    expiry = expiry or {}
+    records = []
+    for name, value in cookies.items():
+        record = {'name': name, 'value': value, 'path': '/', 'domain': host}
+        if expiry.get(name) is not None:
+            record['expiry'] = int(expiry[name])
+        records.append(record)
+    try:
+        store_session(site, records)
+    except Exception as e:
+        print(f"[{site}] Warning: Could not save cookies: {e}")
+
+
+def http_collect_site(site, password):
+    """
+    Collect one site over plain HTTP: try the saved session cookies against
+    /details, log in with the form if that lands on the login page, then parse
+    the details HTML. Returns (internal_free, external_free); raises on network
+    errors or if the login is rejected so the caller can fall back to Selenium.
+    """
+    conn_cache = {}
+    cookies = load_http_cookies(site)
+    details_url = site_url(site, "/details")
+    timeouts = load_site_inventory().lookup(site)
+    try:
+        with timed_phase(site, "http_details_load"):
+            url, status, html = http_request(conn_cache, 'GET', details_url, cookies,
+                                             timeout=timeouts.details_timeout)
+            root = parse_html(html)
+        login_form = find_login_form(root, url)
+        if login_form is None and cookies:
+            mark_session_validated(site)
+        if login_form is not None:
+            if DEBUG_MODE:
+                print(f"[{site}] HTTP: session cookies missing or expired, logging in")
+            cookies.clear()
+            cookie_expiry = {}
+            with timed_phase(site, "http_login"):
+                url, status, html = http_request(conn_cache, 'GET', site_url(site), cookies,
+                                                 timeout=timeouts.page_load_timeout,
+                                                 cookie_expiry=cookie_expiry)
+                root = parse_html(html)
+                login_form = find_login_form(root, url) or (url, {})
+                action, fields = login_form
+                fields.update({'login_username': username, 'login_password': password})
+                url, status, html = http_request(conn_cache, 'POST', action, cookies, data=fields,
+                                                 timeout=timeouts.page_load_timeout,
+                                                 cookie_expiry=cookie_expiry)
+                if find_login_form(parse_html(html), url) is not None:
+                    raise RuntimeError("login rejected - still on login page")
+            print(f"[{site}] Logged in successfully (HTTP).")
+            save_http_cookies(site, cookies, cookie_expiry)
+
+            with timed_phase(site, "http_details_load"):
+                url, status, html = http_request(conn_cache, 'GET', details_url, cookies,
+                                             timeout=timeouts.details_timeout)
+                root = parse_html(html)
+            if find_login_form(root, url) is not None:
+                raise RuntimeError("details page still asks for login")
+        if status >= 400:
+            raise RuntimeError(f"HTTP {status} for {details_url}")
+    finally:
+        for conn in conn_cache.values():
+            conn.close()
+    archive_page(site, html)
+
+    with timed_phase(site, "parse"):
+        return extract_storage_from_dom(root, site)
+
+
+async def collect_http_async(sites, concurrency):
+    """
+    Poll `sites` over HTTP with at most `concurrency` in flight. The requests
+    themselves are blocking http.client calls, so each site's collection runs
+    on a pool of `concurrency` threads; asyncio only schedules them.
+    Returns (results, failed_sites); results are in `sites` order and failed
+    sites are those whose HTTP collection raised or found no storage data.
+    """
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    # Sized to `concurrency`: the default executor can be smaller on few-core hosts
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="http")
+    loop = asyncio.get_running_loop()
+
+    async def run_site(site):
+        async with semaphore:
+            print(f"Accessing site: {site} (HTTP)")
+            try:
+                internal_free, external_free = await loop.run_in_executor(
+                    executor, http_collect_site, site, password_dict[site])
+            except Exception as e:
+                print(f"[{site}] HTTP collection failed: {e.__class__.__name__}: {e}")
+                return site, None
+            if DEBUG_MODE:
+                print(f"[{site}] Final result: internal={internal_free}%, external={external_free}%")
+            result = make_result(site, internal_free, external_free)
+            if internal_free is not None:
+                # Sites without data go to the Selenium fallback, which streams its own result
+                stream_result(result)
+            return site, result
+
+    runnable = []
+    for site in sites:
+        if site not in password_dict:
+            print(f"No password found for site {site}; skipping.")
+        else:
+            runnable.append(site)
+
+    try:
+        outcomes = await asyncio.gather(*(run_site(site) for site in runnable))
+    finally:
+        executor.shutdown(wait=False)
+    results = []
+    failed_sites = []
+    for site, result in outcomes:
+        if result is None or result["internal_free"] is None:
+            failed_sites.append(site)
+        results.append(result)
+    return results, failed_sites
+
+
+def collect_http(sites, concurrency, workers=1):
+    """
+    Collect with the HTTP backend and fall back to Selenium for any site where
+    the HTTP path failed. Results are returned in `sites` order.
+    """
+    import asyncio
+    results, failed_sites = asyncio.run(collect_http_async(sites, concurrency))
+    by_site = {r["site"]: r for r in results if r is not None}
+
+    if failed_sites:
+        print(f"Falling back to Selenium for {len(failed_sites)} sites: {', '.join(failed_sites)}")
+        try:
+            if workers > 1:
+                fallback = collect_concurrent(failed_sites, workers)
+            else:
+                fallback = collect_sequential(failed_sites)
+        except Exception as e:
+            # Keep the HTTP results even if the browser cannot be started; a site
+            # whose HTTP attempt timed out is reported as such for its circuit breaker
+            print(f"Selenium fallback failed: {e.__class__.__name__}: {e}")
+            fallback = [stream_result(make_result(site, None, None,
+                                                  status=None if site_timed_out(site) else "error"))
+                        for site in failed_sites if site not in by_site]
+        for r in fallback:
+            by_site[r["site"]] = r
+
+    return [by_site[site] for site in sites if site in by_site]
+
+
+######################
+# History store
+######################
+
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS storage_history (
+    site TEXT NOT NULL,
+    ts REAL NOT NULL,
+    internal_free INTEGER,
+    external_free INTEGER,
+    status TEXT NOT NULL,
+    seq INTEGER,
+    PRIMARY KEY (site, ts)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS storage_history_ts ON storage_history (ts);
+"""
+
+# `seq` numbers the record_history call that last wrote a row, so readers can
+# pick up every changed row (including late ones with an old ts) since a given
+# seq. Stores created before it get the column, NULL in their existing rows.
+HISTORY_SEQ_INDEX = "CREATE INDEX IF NOT EXISTS storage_history_seq ON storage_history (seq)"
+
+
+def open_history(db_path=None):
+    """
+    Open (creating if needed) the SQLite history store in WAL mode.
+    Rows are clustered on (site, ts), so per-site time-range lookups are
+    index seeks rather than scans; a secondary index covers all-site ranges.
+    """
+    db_path = db_path or HISTORY_DB_PATH
+    db_dir = os.path.dirname(db_path)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(HISTORY_SCHEMA)
+    if "seq" not in {row[1] for row in conn.execute("PRAGMA table_info(storage_history)")}:
+        conn.execute("ALTER TABLE storage_history ADD COLUMN seq INTEGER")
+    conn.execute(HISTORY_SEQ_INDEX)
+    return conn
+
+
+def record_history(results, db_path=None, ts=None):
+    """
+    Append one timestamped row per site in `results` to the history store.
+    A result carrying its own "ts" (e.g. resumed from the result stream) keeps it.
+    A row already stored for the same site and time is overwritten, and gets
+    this call's seq, only if its values differ.
+    """
+    ts = time.time() if ts is None else ts
+    rows = [(r["site"], r.get("ts", ts), r["internal_free"], r["external_free"], r.get("status", "ok"))
+            for r in results]
+    conn = open_history(db_path)
+    try:
+        with conn:
+            # Take the write lock before reading MAX(seq), so concurrent shards get distinct seqs
+            conn.execute("BEGIN IMMEDIATE")
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM storage_history").fetchone()[0]
+            conn.executemany(
+                "INSERT INTO storage_history (site, ts, internal_free, external_free, status, seq) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (site, ts) DO UPDATE SET "
+                "internal_free = excluded.internal_free, external_free = excluded.external_free, "
+                "status = excluded.status, seq = excluded.seq "
+                "WHERE internal_free IS NOT excluded.internal_free OR external_free IS NOT excluded.external_free "
+                "OR status IS NOT excluded.status", [row + (seq,) for row in rows])
+    finally:
+        conn.close()
+    return len(rows)
+
+
+def query_history(site=None, start=None, end=None, db_path=None):
+    """
+    Return history rows as dicts ordered by site then time, optionally limited to
+    one `site` and/or a [`start`, `end`] range of epoch seconds or datetimes.
+    """
+    clauses = []
+    params = []
+    if site is not None:
+        clauses.append("site = ?")
+        params.append(site)
+    if start is not None:
+        clauses.append("ts >= ?")
+        params.append(start.timestamp() if isinstance(start, datetime) else start)
+    if end is not None:
+        clauses.append("ts <= ?")
+        params.append(end.timestamp() if isinstance(end, datetime) else end)
+    sql = "SELECT site, ts, internal_free, external_free, status FROM storage_history"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY site, ts"
+
+    conn = open_history(db_path)
+    try:
+        return [{"site": row[0], "ts": row[1], "internal_free": row[2],
+                 "external_free": row[3], "status": row[4]}
+                for row in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+
+def results_as_of(ts, sites=None, db_path=None):
+    """Latest history row for each site at or before `ts`, in site order."""
+    conn = open_history(db_path)
+    try:
+        results = []
+        for site in sites or load_site_inventory().names:
+            row = conn.execute(
+                "SELECT internal_free, external_free, status FROM storage_history "
+                "WHERE site = ? AND ts <= ? ORDER BY ts DESC LIMIT 1", (site, ts)).fetchone()
+            if row is not None:
+                results.append(make_result(site, row[0], row[1], status=row[2]))
+        return results
+    finally:
+        conn.close()
+
+
+######################
+# Fill-rate forecasting
+######################
+
+# Free-space colour bands used by the figure (lower bound of each band, in %)
+GREEN_THRESHOLD = 50
+YELLOW_THRESHOLD = 35
+RED_THRESHOLD = 20
+
+VOLUMES = ("internal", "external")
+
+
+def get_color(free_val):
+    if free_val >= GREEN_THRESHOLD:
+        return 'green'
+    elif free_val >= YELLOW_THRESHOLD:
+        return 'yellow'
+    elif free_val >= RED_THRESHOLD:
+        return 'orange'
+    else:
+        return 'red'
+
+
+def get_colors(free_values):
+    """get_color for a whole NumPy array of percentages at once (NaN gives 'red'; mask it out)."""
+    import numpy as np
+    return np.select([free_values >= GREEN_THRESHOLD, free_values >= YELLOW_THRESHOLD,
+                      free_values >= RED_THRESHOLD], ['green', 'yellow', 'orange'], 'red')
+
+
+def load_history_window(now=None, window_days=None, db_path=None):
+    """
+    Read the last `window_days` of history straight into NumPy arrays.
+    Returns (sites, ts, free) where `free` has one column per entry in VOLUMES
+    and NaN for missing readings.
+    """
+    import numpy as np
+    now = time.time() if now is None else now
+    window_days = FORECAST_WINDOW_DAYS if window_days is None else window_days
+    conn = open_history(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT site, ts, internal_free, external_free FROM storage_history "
+            "WHERE ts >= ? AND ts <= ?", (now - window_days * 86400, now)).fetchall()
+    finally:
+        conn.close()
+    if not rows:
+        return np.array([], dtype=str), np.array([]), np.empty((0, len(VOLUMES)))
+    sites, ts, internal, external = zip(*rows)
+    # dtype=float turns None into NaN
+    free = np.column_stack([np.array(internal, dtype=float), np.array(external, dtype=float)])
+    return np.array(sites), np.array(ts, dtype=float), free
+
+
+def forecast_fill(sites, ts, free, now=None, min_samples=None):
+    """
+    Fit a straight line to free space over time for every (site, volume) series
+    at once and estimate when each crosses RED_THRESHOLD and 0%.
+
+    All series are fitted together: per-series least-squares sums are built with
+    np.bincount, so the cost is one vectorised pass over the samples no matter
+    how many sites there are. Returns {site: {volume: forecast}} where forecast
+    holds slope_per_day, days_to_red and days_to_empty (None when the volume is
+    not shrinking, the crossing is beyond FORECAST_HORIZON_DAYS, or there are too
+    few samples; 0 when already past the mark).
+    """
+    import numpy as np
+    now = time.time() if now is None else now
+    min_samples = FORECAST_MIN_SAMPLES if min_samples is None else min_samples
+    if len(sites) == 0:
+        return {}
+
+    site_names, codes = np.unique(sites, return_inverse=True)
+    n_vol = free.shape[1]
+    n_series = len(site_names) * n_vol
+
+    # One series per (site, volume); measure time in days relative to now
+    series = (codes[:, None] * n_vol + np.arange(n_vol)).ravel()
+    t = np.repeat((ts - now) / 86400.0, n_vol)
+    y = free.ravel()
+    valid = ~np.isnan(y)
+    series, t, y = series[valid], t[valid], y[valid]
+
+    n = np.bincount(series, minlength=n_series).astype(float)
+    s_t = np.bincount(series, weights=t, minlength=n_series)
+    s_y = np.bincount(series, weights=y, minlength=n_series)
+    s_tt = np.bincount(series, weights=t * t, minlength=n_series)
+    s_ty = np.bincount(series, weights=t * y, minlength=n_series)
+
+    denom = n * s_tt - s_t * s_t
+    fit = (n >= min_samples) & (denom > 1e-12)
+    slope = np.full(n_series, np.nan)
+    slope[fit] = (n[fit] * s_ty[fit] - s_t[fit] * s_y[fit]) / denom[fit]
+    level_now = np.full(n_series, np.nan)
+    level_now[fit] = (s_y[fit] - slope[fit] * s_t[fit]) / n[fit]
+
+    def days_to(threshold):
+        days = np.full(n_series, np.nan)
+        shrinking = fit & (slope < 0)
+        days[shrinking] = (threshold - level_now[shrinking]) / slope[shrinking]
+        # A nearly flat series gives a meaningless crossing centuries away
+        days[days > FORECAST_HORIZON_DAYS] = np.nan
+        return np.where(fit & (level_now <= threshold), 0.0, days)
+
+    days_red = days_to(RED_THRESHOLD)
+    days_empty = days_to(0)
+
+    def clean(value):
+        return None if np.isnan(value) else round(float(value), 1)
+
+    forecasts = {}
+    for i, site in enumerate(site_names):
+        per_site = {}
+        for v, volume in enumerate(VOLUMES[:n_vol]):
+            k = i * n_vol + v
+            per_site[volume] = {
+                "slope_per_day": clean(slope[k]),
+                "days_to_red": clean(days_red[k]),
+                "days_to_empty": clean(days_empty[k]),
+            }
+        forecasts[str(site)] = per_site
+    return forecasts
+
+
+def compute_forecasts(now=None, db_path=None):
+    """Forecast every site from the history store's sliding window."""
+    sites, ts, free = load_history_window(now=now, db_path=db_path)
+    return forecast_fill(sites, ts, free, now=now)
+
+
+def format_forecast(forecast):
+    """
+    Short human-readable form of one volume's forecast, or '' if there is
+    nothing to say: when it turns red, or when it fills up if already red.
+    """
+    if not forecast or forecast["days_to_red"] is None:
+        return ""
+    if forecast["days_to_red"] > 0:
+        return f"red in ~{forecast['days_to_red']:.0f}d"
+    if forecast["days_to_empty"] is not None:
+        return f"full in ~{forecast['days_to_empty']:.0f}d"
+    return ""
+
+
+def create_figure(results, output_path, forecasts=None, timestamp=None, formats=None, cache=None):
+    """
+    Takes `results` (list of dicts with keys: site, internal_free, external_free),
+    creates a horizontal bar chart, and saves it to `output_path`.
+
+    Features:
+    1. Leaves an empty space for sites that can't be accessed (i.e., missing data).
+    2. Colors each bar based on free-space percentage:
+       100–50: green, 50–35: yellow, 35–20: orange, 20–0: red.
+    3. Differentiates internal vs external storage using hatch patterns.
+    4. Moves the legend outside the plot to the top right.
+    5. Adds vertical padding between each site group while keeping the two bars for the same site contiguous.
+    6. Inserts an extra vertical gap between frequency groups.
+    7. If `forecasts` (from compute_forecasts) is given, appends the estimated
+       days until red / full to each bar's label.
+    8. Writes every format in `formats` (default: FIGURE_FORMATS) from the one
+       drawing: "png", "svg", "pdf", and "json" for a small summary of the bars.
+    9. Skips drawing if the results, labels, layout and formats hash the same as
+       for the previous figure and its files still exist (see RENDER_CACHE;
+       `cache` overrides it for this call). An explicit `timestamp` is part of
+       the hash, so rendering another time never returns the last figure.
+    Positions, widths and colors are built as NumPy arrays, and each volume is
+    drawn with one barh and one bar_label call.
+    `timestamp` (a datetime) dates the title and file names; it defaults to now.
+    Returns the paths written (or kept).
+    """
+    import hashlib
+
+    def bar_label(r, volume):
+        label = f'{r[volume + "_free"]}%'
+        note = format_forecast((forecasts or {}).get(r["site"], {}).get(volume))
+        return f"{label}  ({note})" if note else label
+
+    formats = [fmt.lower() for fmt in (formats or FIGURE_FORMATS)]
+    inventory = load_site_inventory()
+    explicit_time = timestamp is not None
+    timestamp = timestamp or datetime.now()
+    current_time = timestamp.strftime("%Y-%m-%d %H:%M:%S")
+    save_time = timestamp.strftime("%Y%m%d_%H%M")
+    base_path = f"{output_path}/MARACOOS_Storage_Space_{save_time}"
+
+    # Ensure output directory exists
+    os.makedirs(output_path, exist_ok=True)
+
     # Reverse the results for plotting order.
     ordered_results = results[::-1]
     n_groups = len(ordered_results)
-    
+    site_labels = [r["site"] for r in ordered_results]
+    freqs = [inventory.lookup(site).group for site in site_labels]
+    labels = {volume: [bar_label(r, volume) if r[volume + "_free"] is not None else ""
+                       for r in ordered_results] for volume in VOLUMES}
+
+    # Everything the figure shows except the time of a live run, so an unchanged
+    # poll is not redrawn; a figure asked for at a given time (render, --as-of)
+    # must be of that time
+    input_hash = hashlib.sha256(json.dumps(
+        [site_labels, freqs, [[r["internal_free"], r["external_free"]] for r in ordered_results],
+         labels, formats, current_time if explicit_time else None]).encode()).hexdigest()
+    cache_path = os.path.join(output_path, RENDER_CACHE_FILE)
+    if RENDER_CACHE if cache is None else cache:
+        try:
+            with open(cache_path, "r") as f:
+                previous = json.load(f)
+            if previous["hash"] == input_hash and all(os.path.exists(p) for p in previous["files"]):
+                print(f"Figure unchanged since {previous['timestamp']}; keeping {', '.join(previous['files'])}")
+                return previous["files"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            pass
+
+    import numpy as np
+
     # Parameters for group heights and gaps.
     group_height = 0.8       # Height for each site's group (both internal and external bars)
     regular_gap = 0.5        # Regular gap between sites
     extra_freq_gap = 1.0     # Extra gap inserted when frequency group changes
 
-    # Compute y-positions for each site group, adding extra gap when the frequency changes.
-    y_positions = []
-    current_y = 0
-    previous_freq = None
-    for r in ordered_results:
-        site = r["site"]
-        freq = frequency_mapping.get(site, None)
-        if previous_freq is not None and freq != previous_freq:
-            current_y += extra_freq_gap
-        y_positions.append(current_y)
-        current_y += group_height + regular_gap
-        previous_freq = freq
-
+    # y-positions of each site group: regular steps, plus an extra gap every
+    # time the frequency group changes.
+    freq_changes = np.zeros(n_groups)
+    for i in range(1, n_groups):
+        freq_changes[i] = freqs[i - 1] is not None and freqs[i] != freqs[i - 1]
+    y_positions = np.arange(n_groups) * (group_height + regular_gap) + np.cumsum(freq_changes) * extra_freq_gap
     # Compute y-tick positions (center of each group)
-    y_tick_positions = [y + group_height/2 for y in y_positions]
-    site_labels = [r["site"] for r in ordered_results]
-    
-    fig, ax = plt.subplots(figsize=(10, 6))
-    
-    # Plot each site's bars.
-    for idx, (r, y_pos) in enumerate(zip(ordered_results, y_positions)):
-        # Internal storage: lower half of the group.
-        if r["internal_free"] is not None:
-            color_internal = get_color(r["internal_free"])
-            ax.barh(y_pos, r["internal_free"], height=group_height/2,
-                    color=color_internal, edgecolor='black', align='edge')
-            center_internal = y_pos + (group_height/2) / 2
-            ax.annotate(f'{r["internal_free"]}%',
-                        xy=(r["internal_free"], center_internal),
-                        xytext=(3, 0),
-                        textcoords="offset points",
-                        ha='left', va='center', fontsize=8)
-        # External storage: upper half of the group.
-        if r["external_free"] is not None:
-            color_external = get_color(r["external_free"])
-            external_y = y_pos + group_height/2
-            ax.barh(external_y, r["external_free"], height=group_height/2,
-                    color=color_external, hatch='//', edgecolor='black', align='edge')
-            center_external = external_y + (group_height/2) / 2
-            ax.annotate(f'{r["external_free"]}%',
-                        xy=(r["external_free"], center_external),
-                        xytext=(3, 0),
-                        textcoords="offset points",
-                        ha='left', va='center', fontsize=8)
-    
-    ax.set_xlabel('Free Space (%)')
-    ax.set_xlim([0, 100])
-    ax.set_yticks(y_tick_positions)
-    ax.set_yticklabels(site_labels)
-    ax.set_title('RUCODAR Site Computer Storage Space as of ' + current_time)
-    
-    legend_handles = [
-        Patch(facecolor='gray', label='Internal Free (%)'),
-        Patch(facecolor='gray', hatch='//', label='External Free (%)')
-    ]
-    ax.legend(handles=legend_handles, bbox_to_anchor=(1.0, 1.0), loc='upper left', borderaxespad=0.)
-    
-    plt.tight_layout()
-    plt.savefig(full_output_path, dpi=150)
-    plt.close(fig)
-    print(f"Saved figure to {full_output_path}")
+    y_tick_positions = y_positions + group_height / 2
 
+    values = {volume: np.array([np.nan if r[volume + "_free"] is None else r[volume + "_free"]
+                                for r in ordered_results], dtype=float) for volume in VOLUMES}
+    colors = {volume: get_colors(values[volume]) for volume in VOLUMES}
 
-def main():
-    # Load credentials at startup
-    global username, password_dict
-    username, password_dict = load_credentials()
-    print(f"Loaded credentials for {len(password_dict)} sites")
+    written = []
+    figure_formats = [fmt for fmt in formats if fmt != "json"]
+    if figure_formats:
+        import matplotlib
+        # Use a non-interactive backend so plotting can work on a headless server
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        from matplotlib.patches import Patch
 
-    # Parse command line arguments
-    parser = argparse.ArgumentParser(description='MARACOOS Storage Space Monitor')
-    parser.add_argument('--refresh-cookies', action='store_true', 
-                       help='Force refresh of all cookies by deleting existing ones')
-    parser.add_argument('--debug', action='store_true',
-                       help='Enable debug mode for detailed output')
-    args = parser.parse_args()
+        # Grow taller beyond ~23 sites so the labels stay readable
+        fig, ax = plt.subplots(figsize=(10, max(6, 0.26 * n_groups)))
+        # Internal storage fills the lower half of each group, external (hatched) the upper half
+        for volume, offset, hatch in (("internal", 0.0, None), ("external", group_height / 2, '//')):
+            present = ~np.isnan(values[volume])
+            if not present.any():
+                continue
+            bars = ax.barh(y_positions[present] + offset, values[volume][present], height=group_height / 2,
+                           color=colors[volume][present].tolist(), hatch=hatch, edgecolor='black',
+                           align='edge')
+            ax.bar_label(bars, labels=[labels[volume][i] for i in np.flatnonzero(present)],
+                         padding=3, fontsize=8)
 
-    # Set global debug mode
-    global DEBUG_MODE
-    DEBUG_MODE = args.debug
+        ax.set_xlabel('Free Space (%)')
+        ax.set_xlim([0, 100])
+        ax.set_yticks(y_tick_positions)
+        ax.set_yticklabels(site_labels)
+        ax.set_title('RUCODAR Site Computer Storage Space as of ' + current_time)
 
-    # Handle cookie refresh
-    if args.refresh_cookies:
-        cookie_files = glob.glob(f"{COOKIE_PATH}/*.pkl")
-        for cookie_file in cookie_files:
-            os.remove(cookie_file)
-        print(f"Deleted {len(cookie_files)} existing cookie files. Will create fresh ones.")
+        legend_handles = [
+            Patch(facecolor='gray', label='Internal Free (%)'),
+            Patch(facecolor='gray', hatch='//', label='External Free (%)')
+        ]
+        ax.legend(handles=legend_handles, bbox_to_anchor=(1.0, 1.0), loc='upper left', borderaxespad=0.)
 
-    # Ensure cookie directory exists
-    os.makedirs(COOKIE_PATH, exist_ok=True)
+        plt.tight_layout()
+        for fmt in figure_formats:
+            full_output_path = f"{base_path}.{fmt}"
+            # fig.savefig, not plt.savefig, which redraws the whole figure after saving
+            fig.savefig(full_output_path, dpi=150)
+            written.append(full_output_path)
+            print(f"Saved figure to {full_output_path}")
+        plt.close(fig)
 
-    driver = create_webdriver(headless=HEADLESS)
+    if "json" in formats:
+        summary = {
+            "timestamp": timestamp.isoformat(timespec="seconds"),
+            "input_hash": input_hash,
+            "bands": {volume: {band: int(np.sum(colors[volume][~np.isnan(values[volume])] == band))
+                               for band in ("green", "yellow", "orange", "red")} for volume in VOLUMES},
+            "missing": [r["site"] for r in results if r["internal_free"] is None and r["external_free"] is None],
+            "sites": [{"site": r["site"], "group": freqs[n_groups - 1 - i],
+                       "internal_free": r["internal_free"], "external_free": r["external_free"],
+                       "status": r.get("status"),
+                       "labels": {volume: labels[volume][n_groups - 1 - i] for volume in VOLUMES}}
+                      for i, r in enumerate(results)],
+        }
+        full_output_path = f"{base_path}.json"
+        with open(full_output_path, "w") as f:
+            json.dump(summary, f, indent=1)
+        written.append(full_output_path)
+        print(f"Saved figure summary to {full_output_path}")
 
-    # For each site, login and gather storage stats
-    results = []  # Will hold dicts like: {"site": site, "internal_free": X, "external_free": Y}
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"hash": input_hash, "timestamp": current_time, "files": written}, f)
+    os.replace(tmp_path, cache_path)
+    return written
 
-    for site in site_list:
-        print(f"Accessing site: {site}")
-        if site not in password_dict:
-            print(f"No password found for site {site}; skipping.")
-            continue
 
+def make_result(site, internal_free, external_free, status=None):
+    """
+    Build the per-site result dict used by the summary, figure and history store.
+    `status` defaults to "ok" when any storage value was read and "no_data" otherwise;
+    a failed collection in which a phase timed out is reported as "timeout".
+    """
+    if status is None:
+        status = "ok" if internal_free is not None or external_free is not None else "no_data"
+    if status in ("no_data", "login_failed") and site_timed_out(site):
+        status = "timeout"
+    return {
+        "site": site,
+        "internal_free": internal_free,
+        "external_free": external_free,
+        "status": status
+    }
+
+
+def collect_site(driver, site):
+    """
+    Log in to `site` with `driver` and read its storage stats.
+    Returns a result dict (see make_result), or None
+    if there is no password for the site and it should be skipped.
+    """
+    print(f"Accessing site: {site}")
+    if site not in password_dict:
+        print(f"No password found for site {site}; skipping.")
+        return None
+
+    try:
         success = login_and_navigate(driver, site, password_dict[site])
         if not success:
-            results.append({"site": site, "internal_free": None, "external_free": None})
-            continue
+            return stream_result(make_result(site, None, None, status="login_failed"))
         else:
             print(f"Successfully logged in to {site}")
 
         internal_free, external_free = get_storage_info(driver, site)
-        results.append({
-            "site": site,
-            "internal_free": internal_free,
-            "external_free": external_free
-        })
+        result = make_result(site, internal_free, external_free)
 
         if DEBUG_MODE:
             print(f"[{site}] Final result: internal={internal_free}%, external={external_free}%")
-
-        # Close the site tab if you want to keep things clean
+        stream_result(result)
+    finally:
+        # Close the site tab, also when the login failed, so tabs don't pile up
         if len(driver.window_handles) > 1:
             driver.close()
             driver.switch_to.window(driver.window_handles[-1])
 
-    driver.quit()
+    return result
 
-    # Print summary
-    print("\n=== STORAGE SUMMARY ===")
-    for result in results:
-        site = result["site"]
-        internal = result["internal_free"]
-        external = result["external_free"]
-        internal_str = f"{internal}%" if internal is not None else "N/A"
-        external_str = f"{external}%" if external is not None else "N/A"
-        print(f"{site}: Internal={internal_str}, External={external_str}")
 
-    # Generate the horizontal bar chart figure with extra frequency-group padding
-    create_figure(results, OUTPUT_FIGURE_PATH)
+def collect_sequential(sites):
+    """Visit every site in order with a single (periodically recycled) WebDriver session."""
+    manager = DriverManager(headless=HEADLESS)
+    results = []  # Will hold dicts like: {"site": site, "internal_free": X, "external_free": Y}
+    try:
+        for site in sites:
+            result = collect_site(manager.get(), site)
+            manager.site_done()
+            if result is not None:
+                results.append(result)
+    finally:
+        manager.quit()
+    return results
+
+
+def collect_concurrent(sites, workers):
+    """
+    Visit `sites` with a bounded pool of up to `workers` independent WebDriver
+    sessions. Each session logs in and reads storage on its own; results are
+    returned in the same order as `sites`, so the figure layout is unchanged.
+    A site that raises is recorded as missing data and its browser is recycled.
+    """
+    n_workers = max(1, min(workers, len(sites)))
+    idle_managers = queue.Queue()
+    all_managers = []
+    managers_lock = threading.Lock()
+    print(f"Polling {len(sites)} sites with {n_workers} WebDriver sessions")
+
+    def run_site(site):
+        # Sessions are created lazily, so at most `n_workers` ever exist
+        try:
+            manager = idle_managers.get_nowait()
+        except queue.Empty:
+            manager = DriverManager(headless=HEADLESS)
+            with managers_lock:
+                all_managers.append(manager)
+        try:
+            result = collect_site(manager.get(), site)
+            manager.site_done()
+        except Exception as e:
+            print(f"[{site}] Worker error: {e}")
+            manager.quit()
+            result = stream_result(make_result(site, None, None, status="error"))
+        idle_managers.put(manager)
+        return result
+
+    try:
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            ordered = list(executor.map(run_site, sites))
+    finally:
+        for manager in all_managers:
+            manager.quit()
+
+    return [r for r in ordered if r is not None]
+
+
+######################
+# Result stream and resume
+######################
+
+class ResultSink:
+    """
+    Append every site result to the day's JSON-lines and CSV files the moment
+    it is collected (flushed and fsync'd), so a crash loses at most the site
+    in progress and `--resume` can pick up where the run stopped.
+    """
+    CSV_FIELDS = ["run", "ts", "collected_at", "site", "internal_free", "external_free", "status"]
+
+    def __init__(self, run_ts, directory=None):
+        self.directory = directory or RESULTS_STREAM_PATH
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self.start_run(run_ts)
+
+    def start_run(self, run_ts):
+        """Tag the following results with a new run (each --watch cycle is one)."""
+        self.run_ts = run_ts
+        self.run_id = datetime.fromtimestamp(run_ts).strftime("%Y%m%d_%H%M%S")
+
+    def write(self, result):
+        # "ts" is the run's timestamp (the one used in the history store);
+        # "collected_at" is when this particular site finished
+        row = {"run": self.run_id, "ts": self.run_ts, "collected_at": time.time(), "site": result["site"],
+               "internal_free": result["internal_free"], "external_free": result["external_free"],
+               "status": result.get("status", "ok")}
+        jsonl_path, csv_path = result_stream_paths(datetime.fromtimestamp(row["collected_at"]), self.directory)
+        with self.lock:
+            with open(jsonl_path, "a") as f:
+                f.write(json.dumps(row) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            new_csv = not os.path.exists(csv_path)
+            with open(csv_path, "a", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=self.CSV_FIELDS)
+                if new_csv:
+                    writer.writeheader()
+                writer.writerow(row)
+                f.flush()
+                os.fsync(f.fileno())
+
+
+# Set by main() for collecting commands; None means results are not streamed
+result_sink = None
+
+
+def stream_result(result):
+    """Send `result` to the active ResultSink (if any) and return it unchanged."""
+    if result_sink is not None:
+        try:
+            result_sink.write(result)
+        except OSError as e:
+            print(f"[{result['site']}] Warning: Could not stream result: {e}")
+    return result
+
+
+def result_stream_paths(day, directory=None):
+    """The (JSON lines, CSV) stream files for the calendar day of `day`."""
+    directory = directory or RESULTS_STREAM_PATH
+    stem = f"results_{day.strftime('%Y%m%d')}"
+    return os.path.join(directory, stem + ".jsonl"), os.path.join(directory, stem + ".csv")
+
+
+def load_fresh_results(window_minutes, now=None, directory=None):
+    """
+    Latest successful streamed result per site newer than `window_minutes`,
+    as {site: result}. Only the day files overlapping the window are read.
+    """
+    now = time.time() if now is None else now
+    cutoff = now - window_minutes * 60
+    fresh = {}
+    day = datetime.fromtimestamp(cutoff).date()
+    while day <= datetime.fromtimestamp(now).date():
+        jsonl_path, _ = result_stream_paths(day, directory)
+        try:
+            with open(jsonl_path, "r") as f:
+                for line in f:
+                    try:
+                        row = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A crash can leave a half-written last line
+                        continue
+                    if row.get("status") == "ok" and cutoff <= row["collected_at"] <= now:
+                        result = make_result(row["site"], row["internal_free"], row["external_free"], "ok")
+                        result["ts"] = row["ts"]
+                        fresh[row["site"]] = result
+        except FileNotFoundError:
+            pass
+        day += timedelta(days=1)
+    return fresh
+
+
+######################
+# Page archive
+######################
+
+class PageArchive:
+    """
+    Content-addressed store of fetched /details pages. Each distinct page is
+    kept once, gzip-compressed, as objects/<sha256[:2]>/<sha256[2:]>.html.gz;
+    captures.jsonl records which site served which page at which run, so
+    repeated identical pages cost one index line and no extra storage.
+    """
+    INDEX_FILE = "captures.jsonl"
+
+    def __init__(self, directory=None):
+        self.directory = directory or ARCHIVE_PATH
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(self.directory, "objects"), exist_ok=True)
+
+    def object_path(self, digest):
+        return os.path.join(self.directory, "objects", digest[:2], digest[2:] + ".html.gz")
+
+    def store(self, site, html, ts=None):
+        """Archive one page for `site`; returns its sha256 digest."""
+        import gzip
+        import hashlib
+        data = html.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+        with self.lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    # mtime=0 keeps the compressed bytes a function of the page alone
+                    f.write(gzip.compress(data, mtime=0))
+                os.replace(tmp_path, path)
+            record = {"site": site, "ts": time.time() if ts is None else ts,
+                      "captured_at": time.time(), "sha256": digest, "bytes": len(data)}
+            with open(os.path.join(self.directory, self.INDEX_FILE), "a") as f:
+                f.write(json.dumps(record) + "\n")
+        return digest
+
+    def load(self, digest):
+        """Return the HTML of an archived page."""
+        import gzip
+        with open(self.object_path(digest), "rb") as f:
+            return gzip.decompress(f.read()).decode("utf-8")
+
+    def captures(self, site=None, since=None):
+        """Capture records in the order they were written, optionally for one `site` / from `since` (epoch)."""
+        records = []
+        try:
+            with open(os.path.join(self.directory, self.INDEX_FILE), "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A line cut short by a crash
+                        continue
+                    if site is not None and record["site"] != site:
+                        continue
+                    if since is not None and record["ts"] < since:
+                        continue
+                    records.append(record)
+        except FileNotFoundError:
+            pass
+        return records
+
+
+# Set by main() when pages are archived (--archive or ARCHIVE_PAGES)
+page_archive = None
+
+
+def archive_page(site, html):
+    """Store a fetched /details page in the active PageArchive, if any."""
+    if page_archive is None:
+        return
+    run_ts = result_sink.run_ts if result_sink is not None else None
+    try:
+        page_archive.store(site, html, run_ts)
+    except OSError as e:
+        print(f"[{site}] Warning: Could not archive details page: {e}")
+
+
+def replay_parse_pages(directory, digests):
+    """
+    Parse a batch of archived pages (runs in a worker process for replay).
+    Returns {digest: (internal_free, external_free) or an error string}.
+    """
+    archive = PageArchive(directory)
+    parsed = {}
+    for digest in digests:
+        try:
+            parsed[digest] = extract_storage_from_dom(parse_html(archive.load(digest)), digest[:8])
+        except Exception as e:
+            parsed[digest] = f"{e.__class__.__name__}: {e}"
+    return parsed
+
+
+def replay(directory=None, site=None, since=None, workers=None, rebuild_history=False):
+    """
+    Re-run storage extraction over every archived page, offline. Each distinct
+    page is parsed once, in batches spread over `workers` processes (default:
+    one per CPU core). Prints parser throughput and how many captures now give
+    a different result from the history store; with `rebuild_history` the
+    replayed results overwrite the history rows of the runs they came from.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    archive = PageArchive(directory)
+    since_ts = since.timestamp() if isinstance(since, datetime) else since
+    captures = archive.captures(site, since_ts)
+    if not captures:
+        print(f"No archived pages in {archive.directory}")
+        return []
+    digests = list(dict.fromkeys(c["sha256"] for c in captures))
+    workers = max(1, min(workers or os.cpu_count() or 1, len(digests)))
+    # A few batches per worker evens out slow pages without per-page IPC
+    batch_size = max(1, -(-len(digests) // (workers * 4)))
+    batches = [digests[i:i + batch_size] for i in range(0, len(digests), batch_size)]
+    print(f"Replaying {len(captures)} captures ({len(digests)} distinct pages) "
+          f"with {workers} worker process{'es' if workers > 1 else ''}")
+
+    parsed = {}
+    start = time.perf_counter()
+    if workers == 1:
+        for batch in batches:
+            parsed.update(replay_parse_pages(archive.directory, batch))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for batch_result in executor.map(replay_parse_pages,
+                                             [archive.directory] * len(batches), batches):
+                parsed.update(batch_result)
+    elapsed = time.perf_counter() - start
+    print(f"Parsed {len(digests)} pages in {elapsed:.2f} s ({len(digests) / elapsed:.0f} pages/s)")
+
+    results = []
+    errors = 0
+    for capture in captures:
+        outcome = parsed[capture["sha256"]]
+        if isinstance(outcome, str):
+            errors += 1
+            if DEBUG_MODE:
+                print(f"[{capture['site']}] {capture['sha256'][:12]}: {outcome}")
+            outcome = (None, None)
+        result = make_result(capture["site"], *outcome)
+        result["ts"] = capture["ts"]
+        results.append(result)
+    no_data = sum(1 for r in results if r["status"] != "ok")
+    print(f"{len(results) - no_data} captures with storage data, {no_data} without ({errors} parse errors)")
+
+    # Compare with what the live runs recorded
+    recorded = {}
+    try:
+        for row in query_history(site, min(r["ts"] for r in results), max(r["ts"] for r in results)):
+            recorded[(row["site"], row["ts"])] = (row["internal_free"], row["external_free"])
+    except sqlite3.Error as e:
+        print(f"Warning: Could not read history: {e}")
+    changed = [r for r in results if (r["site"], r["ts"]) in recorded
+               and recorded[(r["site"], r["ts"])] != (r["internal_free"], r["external_free"])]
+    print(f"{len(changed)} of {sum(1 for r in results if (r['site'], r['ts']) in recorded)} "
+          f"captures found in history now parse differently")
+    if DEBUG_MODE:
+        for r in changed:
+            print(f"  {r['site']} {datetime.fromtimestamp(r['ts']):%Y-%m-%d %H:%M}: "
+                  f"{recorded[(r['site'], r['ts'])]} -> {(r['internal_free'], r['external_free'])}")
+
+    if rebuild_history:
+        count = record_history(results)
+        print(f"Rewrote {count} history rows from the archive")
+    return results
+
+
+######################
+# Sharding
+######################
+
+# (index, count) when this process collects one shard (--shard i/N), else None
+shard = None
+
+
+def shard_of(site, count):
+    """The shard (1..count) that collects `site`; a stable hash, so every host agrees."""
+    import hashlib
+    return int.from_bytes(hashlib.sha256(site.encode()).digest()[:8], "big") % count + 1
+
+
+def parse_shard(value):
+    """argparse type for --shard: 'i/N' with 1 <= i <= N."""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N, e.g. 1/3, got {value!r}")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"shard index must be between 1 and {count}, got {index}")
+    return index, count
+
+
+def shard_file(path):
+    """
+    `path` with the shard inserted before the extension when collecting a shard
+    (latest_results.json -> latest_results.shard-2-of-3.json), so shards running
+    side by side on one host keep their own results, session cache, circuit
+    state and Prometheus file.
+    """
+    if shard is None:
+        return path
+    base, ext = os.path.splitext(path)
+    return f"{base}.shard-{shard[0]}-of-{shard[1]}{ext}"
+
+
+def inventory_digest(sites):
+    """Short fingerprint of a site list, to spot shards run against different inventories."""
+    import hashlib
+    return hashlib.sha256("\n".join(sorted(sites)).encode()).hexdigest()[:16]
+
+
+def shard_metadata(run_ts, sites, backend):
+    """Run metadata stored with a shard's partial results."""
+    return {"index": shard[0], "count": shard[1], "sites": sites, "backend": backend,
+            "host": socket.gethostname(), "pid": os.getpid(),
+            "started": datetime.fromtimestamp(run_ts).isoformat(timespec="seconds"),
+            "finished": datetime.now().isoformat(timespec="seconds"),
+            "inventory": inventory_digest(load_site_inventory().collection_order())}
+
+
+def merge(paths=None, strict=False, record=True, render=True, alerts=True):
+    """
+    Combine the partial result files written by `collect --shard i/N` into the
+    single ordered result set (saved to RESULTS_FILE and recorded in history,
+    each site with its own shard's run time), print the summary and draw the
+    figure. `paths` defaults to every shard file next to RESULTS_FILE.
+    Reports missing shards, sites no shard returned, sites returned by more than
+    one shard (the newest result wins) and shards run against a different site
+    inventory or more than SHARD_MAX_SKEW_MINUTES before the newest one. With
+    `strict`, any of these aborts the merge. Returns True if nothing was wrong.
+
+    To try it locally, run the shards as separate processes and merge:
+        for i in 1 2 3; do python script.py collect --shard $i/3 & done; wait
+        python script.py merge
+    """
+    if not paths:
+        base, ext = os.path.splitext(RESULTS_FILE)
+        paths = sorted(glob.glob(f"{base}.shard-*-of-*{ext}"))
+    partials = []
+    for path in paths:
+        try:
+            with open(path, "r") as f:
+                partial = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Warning: Skipping {path}: {e}")
+            continue
+        if "shard" not in partial:
+            print(f"Warning: Skipping {path}: not a shard result file")
+            continue
+        partial["path"] = path
+        partials.append(partial)
+    if not partials:
+        print("No shard result files to merge")
+        return False
+
+    problems = []
+    newest = max(partials, key=lambda p: p["run_ts"])
+    count = newest["shard"]["count"]
+    other_counts = [p for p in partials if p["shard"]["count"] != count]
+    if other_counts:
+        problems.append(f"ignoring {len(other_counts)} files from runs split into a different number of shards: "
+                        + ", ".join(os.path.basename(p["path"]) for p in other_counts))
+        partials = [p for p in partials if p["shard"]["count"] == count]
+    partials.sort(key=lambda p: p["shard"]["index"])
+
+    inventory = load_site_inventory()
+    expected = inventory.collection_order()
+    digest = inventory_digest(expected)
+    present = {p["shard"]["index"] for p in partials}
+    missing_shards = [i for i in range(1, count + 1) if i not in present]
+    if missing_shards:
+        problems.append(f"missing shards {', '.join(f'{i}/{count}' for i in missing_shards)}")
+    for p in partials:
+        meta = p["shard"]
+        label = f"shard {meta['index']}/{count} ({meta['host']}, {meta['started']})"
+        if meta["inventory"] != digest:
+            problems.append(f"{label} ran against a different site inventory")
+        if newest["run_ts"] - p["run_ts"] > SHARD_MAX_SKEW_MINUTES * 60:
+            problems.append(f"{label} is {(newest['run_ts'] - p['run_ts']) / 60:.0f} min older than the newest shard")
+
+    by_site = {}
+    duplicates = set()
+    for p in partials:
+        for r in p["results"]:
+            r.setdefault("ts", p["run_ts"])
+            if r["site"] in by_site:
+                duplicates.add(r["site"])
+                if r["ts"] <= by_site[r["site"]]["ts"]:
+                    continue
+            by_site[r["site"]] = r
+    if duplicates:
+        problems.append(f"sites returned by more than one shard: {', '.join(sorted(duplicates))}")
+    missing_sites = [site for site in expected if site not in by_site]
+    if missing_sites:
+        problems.append(f"no result for {len(missing_sites)} sites: {', '.join(missing_sites)}")
+    unknown = sorted(set(by_site) - set(inventory.names))
+    if unknown:
+        problems.append(f"dropping sites not in the inventory: {', '.join(unknown)}")
+
+    print(f"Merging {len(partials)} of {count} shards, {len(by_site)} sites")
+    for problem in problems:
+        print(f"Warning: {problem}")
+    if problems and strict:
+        print("Not merging (--strict)")
+        return False
+
+    results = merge_in_site_order(inventory.names, by_site.values())
+    publish_results(results, results, newest["run_ts"], record=record, render=render,
+                    forecast=render, timings=False, alerts=alerts)
+    return not problems
+
+
+######################
+# Circuit breaker
+######################
+
+def load_site_health(path=None):
+    """
+    Load the per-site health record kept across runs:
+    {site: {"failures": consecutive timeouts, "opens": times opened in a row,
+            "open_until": epoch or None, "last_error": str}}.
+    """
+    try:
+        with open(path or shard_file(SITE_HEALTH_FILE), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_site_health(health, path=None):
+    path = path or shard_file(SITE_HEALTH_FILE)
+    health_dir = os.path.dirname(path)
+    if health_dir:
+        os.makedirs(health_dir, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(health, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def probe_site(site):
+    """Cheap reachability check: can we open a TCP connection to the site's web server?"""
+    parts = urlsplit(site_url(site))
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    try:
+        with socket.create_connection((parts.hostname, port), timeout=CIRCUIT_PROBE_TIMEOUT):
+            return True
+    except OSError:
+        return False
+
+
+def check_circuits(sites, health, now=None):
+    """
+    Split `sites` into (runnable, skipped) according to their circuit state.
+    Sites whose backoff has elapsed get a probe: if it connects the site is let
+    through for a trial collection (half-open), otherwise the circuit is
+    re-opened with a longer backoff. Skipped sites get "circuit_open" results.
+    """
+    now = time.time() if now is None else now
+    due_for_probe = []
+    skipped = []
+    for site in sites:
+        open_until = health.get(site, {}).get("open_until")
+        if open_until is None:
+            continue
+        if open_until > now:
+            skipped.append(site)
+        else:
+            due_for_probe.append(site)
+
+    if due_for_probe:
+        with ThreadPoolExecutor(max_workers=min(8, len(due_for_probe))) as executor:
+            probes = dict(zip(due_for_probe, executor.map(probe_site, due_for_probe)))
+        for site, reachable in probes.items():
+            if reachable:
+                print(f"[{site}] Circuit half-open: probe succeeded, trying a full collection")
+            else:
+                open_circuit(site, health, now, "probe failed")
+                skipped.append(site)
+
+    skipped_set = set(skipped)
+    for site in skipped:
+        retry = datetime.fromtimestamp(health[site]["open_until"]).strftime("%H:%M")
+        print(f"[{site}] Circuit open; skipping until {retry}")
+    runnable = [site for site in sites if site not in skipped_set]
+    return runnable, [make_result(site, None, None, status="circuit_open") for site in sites
+                      if site in skipped_set]
+
+
+def open_circuit(site, health, now, reason):
+    """Open (or re-open) `site`'s circuit with exponential backoff."""
+    entry = health.setdefault(site, {"failures": 0, "opens": 0})
+    entry["opens"] = entry.get("opens", 0) + 1
+    backoff = min(CIRCUIT_BASE_BACKOFF * 2 ** (entry["opens"] - 1), CIRCUIT_MAX_BACKOFF)
+    entry["open_until"] = now + backoff
+    entry["last_error"] = reason
+    print(f"[{site}] Circuit opened ({reason}); backing off {backoff / 60:.0f} min")
+
+
+def update_site_health(health, results, now=None):
+    """
+    Update circuit state from a run's results: timeouts count towards opening
+    the circuit after CIRCUIT_FAILURE_THRESHOLD in a row, while any answer
+    from the site (even a failed login) closes it and resets the counts.
+    """
+    now = time.time() if now is None else now
+    for result in results:
+        site = result["site"]
+        status = result.get("status")
+        entry = health.setdefault(site, {"failures": 0, "opens": 0})
+        if status == "timeout":
+            entry["failures"] = entry.get("failures", 0) + 1
+            entry["last_error"] = "TimeoutException"
+            if entry["failures"] >= CIRCUIT_FAILURE_THRESHOLD:
+                open_circuit(site, health, now, f"{entry['failures']} consecutive timeouts")
+        elif status in ("ok", "no_data", "login_failed"):
+            if entry.get("open_until") is not None:
+                print(f"[{site}] Circuit closed")
+            health[site] = {"failures": 0, "opens": 0, "open_until": None}
+
+
+def merge_in_site_order(sites, *result_lists):
+    """Combine result lists into one list ordered like `sites`."""
+    by_site = {}
+    for results in result_lists:
+        for r in results:
+            by_site[r["site"]] = r
+    return [by_site[site] for site in sites if site in by_site]
+
+
+def print_summary(results, forecasts=None):
+    """Print one line per site with free space and, when available, the fill forecast."""
+    print("\n=== STORAGE SUMMARY ===")
+    for result in results:
+        site = result["site"]
+        internal = result["internal_free"]
+        external = result["external_free"]
+        internal_str = f"{internal}%" if internal is not None else "N/A"
+        external_str = f"{external}%" if external is not None else "N/A"
+        line = f"{site}: Internal={internal_str}, External={external_str}"
+        if result.get("status") == "circuit_open":
+            line += "  (circuit open)"
+        notes = []
+        for volume in VOLUMES:
+            note = format_forecast((forecasts or {}).get(site, {}).get(volume))
+            if note:
+                notes.append(f"{volume} {note}")
+        if notes:
+            line += f"  [{'; '.join(notes)}]"
+        print(line)
+    if any(session_stats.values()):
+        print(f"Session cache: {session_stats['hit']} hits, {session_stats['miss']} misses, "
+              f"{session_stats['expired']} expired")
+    if rpc_savings:
+        print(f"Details parsing saved {sum(rpc_savings.values())} WebDriver calls across {len(rpc_savings)} sites")
+
+
+def save_results(results, run_ts, path=None, metadata=None):
+    """
+    Save a run's results (in site order) for the `render` command; a shard
+    saves its partial results with its run `metadata` for `merge` instead.
+    """
+    path = path or shard_file(RESULTS_FILE)
+    results_dir = os.path.dirname(path)
+    if results_dir:
+        os.makedirs(results_dir, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        saved = {"run_ts": run_ts, "results": results}
+        if metadata is not None:
+            saved["shard"] = metadata
+        json.dump(saved, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_results(path=None):
+    """Load results saved by save_results. Returns (results, run_ts)."""
+    with open(path or RESULTS_FILE, "r") as f:
+        saved = json.load(f)
+    return saved["results"], saved["run_ts"]
+
+
+def publish_results(polled, results, run_ts, record=True, render=True, forecast=True,
+                    timings=True, metadata=None, alerts=True):
+    """
+    Write out a collection run: export phase timings and print page traffic and
+    memory use (if `timings`), append the `polled` sites to the history store, save `results` (all sites) for `render`
+    along with any shard `metadata`, forecast, print the summary, send alerts
+    for the `polled` sites (if `alerts` and ALERT_SINKS) and, if `render`,
+    regenerate the figure. Forecasting and rendering are the only steps that
+    load NumPy/matplotlib. Returns the forecasts.
+    """
+    if timings:
+        try:
+            prom_path = export_timings(run_ts)
+            print(f"Wrote phase timings to {prom_path}")
+        except OSError as e:
+            print(f"Warning: Could not export phase timings: {e}")
+        if page_stats:
+            total_kb = sum(r["bytes"] for r in page_stats) / 1024
+            average_ms = sum(r["load_ms"] for r in page_stats) / len(page_stats)
+            print(f"Page traffic{' (lean mode)' if LEAN_MODE else ''}: {len(page_stats)} pages, "
+                  f"{total_kb:.0f} KB transferred, average load {average_ms:.0f} ms")
+        peak_python_mb = python_peak_rss_mb()
+        if driver_stats['peak_rss_mb']:
+            print(f"Peak memory: browser {driver_stats['peak_rss_mb']:.0f} MB, collector {peak_python_mb:.0f} MB "
+                  f"({driver_stats['recycles']} browser restarts, {driver_stats['tabs_closed']} leaked tabs closed)")
+        else:
+            print(f"Peak memory: collector {peak_python_mb:.0f} MB")
+    phase_timings.clear()
+    timed_out_sites.clear()
+    page_stats.clear()
+    driver_stats.update(peak_rss_mb=0.0, recycles=0, tabs_closed=0)
+
+    if record:
+        try:
+            count = record_history(polled, ts=run_ts)
+            print(f"Recorded {count} sites in history database {HISTORY_DB_PATH}")
+        except sqlite3.Error as e:
+            print(f"Warning: Could not record history: {e}")
+
+    try:
+        save_results(results, run_ts, metadata=metadata)
+    except OSError as e:
+        print(f"Warning: Could not save results: {e}")
+
+    alerts = alerts and bool(ALERT_SINKS)
+    forecasts = None
+    if forecast or render or alerts:
+        try:
+            forecasts = compute_forecasts()
+        except sqlite3.Error as e:
+            print(f"Warning: Could not compute forecasts: {e}")
+
+    print_summary(results, forecasts)
+
+    if alerts:
+        process_alerts(polled, forecasts, run_ts)
+
+    if render:
+        # Generate the horizontal bar chart figure with extra frequency-group padding
+        create_figure(results, OUTPUT_FIGURE_PATH, forecasts=forecasts)
+        if DASHBOARD:
+            build_dashboard(results, forecasts, now=run_ts)
+    return forecasts
+
+
+def render(input_path=None, as_of=None, dashboard_only=False):
+    """
+    Draw the figure from saved data without collecting: either the results file
+    written by the last collect run, or (with `as_of`) the latest history row
+    for every site at or before that time. The dashboard (if DASHBOARD) is
+    rebuilt too, except for `as_of`; `dashboard_only` builds just the dashboard.
+    """
+    if as_of is not None:
+        run_ts = as_of.timestamp()
+        results = results_as_of(run_ts)
+        if not results:
+            print(f"No history at or before {as_of}")
+            return
+    else:
+        try:
+            results, run_ts = load_results(input_path)
+        except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
+            print(f"Error: Could not read saved results: {e}")
+            sys.exit(1)
+
+    forecasts = None
+    try:
+        forecasts = compute_forecasts(now=run_ts)
+    except sqlite3.Error as e:
+        print(f"Warning: Could not compute forecasts: {e}")
+
+    if dashboard_only:
+        build_dashboard(results, forecasts)
+        return
+    print_summary(results, forecasts)
+    create_figure(results, OUTPUT_FIGURE_PATH, forecasts=forecasts,
+                  timestamp=datetime.fromtimestamp(run_ts))
+    if DASHBOARD and as_of is None:
+        build_dashboard(results, forecasts)
+
+
+######################
+# Alerts
+######################
+
+# Colour bands from best to worst, as returned by get_color
+BANDS = ("green", "yellow", "orange", "red")
+
+
+def band_with_hysteresis(free_val, previous=None):
+    """
+    get_color with hysteresis: a volume moves into a worse band as soon as it
+    crosses the threshold, but back into a better band only once it is
+    ALERT_HYSTERESIS points above that band's threshold.
+    """
+    band = get_color(free_val)
+    if previous in BANDS and BANDS.index(band) < BANDS.index(previous):
+        band = BANDS[min(BANDS.index(previous), BANDS.index(get_color(free_val - ALERT_HYSTERESIS)))]
+    return band
+
+
+def load_alert_state(path=None):
+    """
+    Load the last known alert state of every site:
+    {site: {"bands": {volume: band}, "failures": failed runs in a row,
+            "failing": bool, "forecast": {volume: bool}}}.
+    """
+    try:
+        with open(path or ALERT_STATE_FILE, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_alert_state(state, path=None):
+    path = path or ALERT_STATE_FILE
+    state_dir = os.path.dirname(path)
+    if state_dir:
+        os.makedirs(state_dir, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def alert_event(run_ts, site, kind, message, volume=None, **details):
+    event = {"ts": run_ts, "time": datetime.fromtimestamp(run_ts).isoformat(timespec="seconds"),
+             "site": site, "kind": kind, "volume": volume, "message": message}
+    event.update(details)
+    return event
+
+
+def evaluate_alerts(results, forecasts, state, run_ts):
+    """
+    Compare this run's `results` with each site's entry in `state` (updated in
+    place) and return the events for what changed:
+      band           a volume moved to another colour band (see band_with_hysteresis);
+                     a site's first reading counts as a move from green
+      failed         ALERT_FAILURE_RUNS collections in a row without data
+      recovered      the first good collection after a "failed" event
+      forecast       red is now forecast within ALERT_FORECAST_DAYS (re-armed once
+                     the forecast is more than twice as far away, or gone)
+    Only the sites in `results` are looked at, so a run costs O(sites) no
+    matter how much history there is.
+    """
+    events = []
+    for result in results:
+        site = result["site"]
+        entry = state.setdefault(site, {"bands": {}, "failures": 0, "failing": False, "forecast": {}})
+        status = result.get("status", "ok")
+
+        if status != "ok":
+            entry["failures"] += 1
+            if entry["failures"] >= ALERT_FAILURE_RUNS and not entry["failing"]:
+                entry["failing"] = True
+                events.append(alert_event(run_ts, site, "failed",
+                                          f"{site}: collection failing ({status}, "
+                                          f"{entry['failures']} runs in a row)", status=status))
+            continue
+        if entry["failing"]:
+            events.append(alert_event(run_ts, site, "recovered", f"{site}: collection recovered"))
+        entry["failures"] = 0
+        entry["failing"] = False
+
+        site_forecast = (forecasts or {}).get(site, {})
+        for volume in VOLUMES:
+            value = result[f"{volume}_free"]
+            if value is None:
+                continue
+            previous = entry["bands"].get(volume)
+            band = band_with_hysteresis(value, previous or "green")
+            entry["bands"][volume] = band
+            if band != (previous or "green"):
+                events.append(alert_event(run_ts, site, "band",
+                                          f"{site} {volume}: {previous or 'new'} -> {band} ({value}% free)",
+                                          volume=volume, previous=previous, band=band, value=value))
+
+            days_to_red = (site_forecast.get(volume) or {}).get("days_to_red")
+            breached = entry["forecast"].get(volume, False)
+            if not breached and days_to_red is not None and days_to_red <= ALERT_FORECAST_DAYS:
+                entry["forecast"][volume] = True
+                if band != "red":
+                    events.append(alert_event(run_ts, site, "forecast",
+                                              f"{site} {volume}: red forecast in ~{days_to_red:.0f}d "
+                                              f"({value}% free)", volume=volume, days_to_red=days_to_red,
+                                              value=value))
+            elif breached and (days_to_red is None or days_to_red > 2 * ALERT_FORECAST_DAYS):
+                entry["forecast"][volume] = False
+    return events
+
+
+def alert_to_file(events, path):
+    """Append the events to `path` as JSON lines."""
+    path_dir = os.path.dirname(path)
+    if path_dir:
+        os.makedirs(path_dir, exist_ok=True)
+    with open(path, "a") as f:
+        for event in events:
+            f.write(json.dumps(event) + "\n")
+
+
+def alert_to_webhook(events, url, timeout=10, headers=None):
+    """
+    POST {"text": one line per event, "events": [...]} as JSON to `url`; the
+    "text" field is what Slack/Mattermost/Teams-style incoming webhooks show.
+    """
+    import urllib.request
+    body = json.dumps({"text": "\n".join(e["message"] for e in events), "events": events}).encode()
+    request = urllib.request.Request(url, data=body, method="POST",
+                                     headers={"Content-Type": "application/json", **(headers or {})})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+
+
+def alert_to_command(events, command, json_lines=False, timeout=60):
+    """
+    Run `command` (an argument list, or a string for the shell) with one line
+    per event on stdin: the message, or the whole event as JSON if `json_lines`.
+    """
+    lines = [json.dumps(e) if json_lines else e["message"] for e in events]
+    subprocess.run(command, input="\n".join(lines) + "\n", text=True, timeout=timeout,
+                   shell=isinstance(command, str), check=True)
+
+
+# ALERT_SINKS "type" -> function(events, **options); add an entry here for a new kind of sink
+ALERT_SINK_TYPES = {"file": alert_to_file, "webhook": alert_to_webhook, "command": alert_to_command}
+
+
+def send_alerts(events, sinks=None):
+    """Hand the events to every configured sink; a failing sink is reported and skipped."""
+    for sink in ALERT_SINKS if sinks is None else sinks:
+        options = dict(sink)
+        kind = options.pop("type", None)
+        if kind not in ALERT_SINK_TYPES:
+            print(f"Warning: Unknown alert sink type {kind!r}")
+            continue
+        try:
+            ALERT_SINK_TYPES[kind](events, **options)
+        except (OSError, ValueError, TypeError, subprocess.SubprocessError) as e:
+            print(f"Warning: Could not send alerts to the {kind} sink: {e}")
+
+
+def process_alerts(results, forecasts, run_ts, path=None):
+    """Evaluate a run's results against the stored alert state, save it and send any events."""
+    state = load_alert_state(path)
+    events = evaluate_alerts(results, forecasts, state, run_ts)
+    try:
+        save_alert_state(state, path)
+    except OSError as e:
+        print(f"Warning: Could not save alert state: {e}")
+    for event in events:
+        print(f"ALERT {event['message']}")
+    if events:
+        send_alerts(events)
+    return events
+
+
+######################
+# Dashboard
+######################
+
+DASHBOARD_STATE_FILE = ".dashboard_state.json"
+FIGURE_NAME_PATTERN = re.compile(r"^MARACOOS_Storage_Space_(\d{8}_\d{4})\.\w+$")
+BAND_COLORS = {"green": "#2e7d32", "yellow": "#f9a825", "orange": "#ef6c00", "red": "#c62828"}
+
+
+def history_buckets(conn, site, after_ts, bucket_seconds):
+    """
+    Sum and count of each volume's free percentage per time bucket for the
+    rows of `site` newer than `after_ts`, aggregated by SQLite:
+    [(bucket, internal_sum, internal_n, external_sum, external_n, last_ts), ...].
+    """
+    return conn.execute(
+        "SELECT CAST(ts / ? AS INTEGER) AS bucket, COALESCE(SUM(internal_free), 0), COUNT(internal_free), "
+        "COALESCE(SUM(external_free), 0), COUNT(external_free), MAX(ts) FROM storage_history "
+        "WHERE site = ? AND ts > ? GROUP BY bucket ORDER BY bucket",
+        (bucket_seconds, site, after_ts)).fetchall()
+
+
+def history_changes(conn, after_seq):
+    """{site: (oldest ts, newest seq)} over the history rows written after `after_seq`."""
+    return {site: (oldest_ts, newest_seq) for site, oldest_ts, newest_seq in conn.execute(
+        "SELECT site, MIN(ts), MAX(seq) FROM storage_history WHERE seq > ? GROUP BY site", (after_seq,))}
+
+
+SPARK_WIDTH = 240
+SPARK_HEIGHT = 48
+# y coordinate text for every free percentage in 0.1 steps, so drawing hundreds
+# of sparklines is string joins rather than float formatting
+SPARK_Y = [f"{SPARK_HEIGHT - tenths / 1000 * SPARK_HEIGHT:.1f}" for tenths in range(1001)]
+
+
+def sparkline_svg(buckets, first_bucket, n_buckets):
+    """
+    Inline SVG of both volumes' bucket averages across the dashboard window
+    (internal solid, external dashed), with the yellow/orange/red thresholds as
+    faint lines. Buckets without data leave a gap in the line.
+    """
+    x_step = SPARK_WIDTH / max(1, n_buckets - 1)
+    parts = [f'<svg class="spark" width="{SPARK_WIDTH}" height="{SPARK_HEIGHT}" '
+             f'viewBox="0 0 {SPARK_WIDTH} {SPARK_HEIGHT}">']
+    for threshold, band in ((GREEN_THRESHOLD, "yellow"), (YELLOW_THRESHOLD, "orange"), (RED_THRESHOLD, "red")):
+        y = SPARK_Y[threshold * 10]
+        parts.append(f'<line x1="0" x2="{SPARK_WIDTH}" y1="{y}" y2="{y}" '
+                     f'stroke="{BAND_COLORS[band]}" stroke-opacity="0.35"/>')
+    for offset, dash in ((1, ""), (3, ' stroke-dasharray="3 2"')):
+        path = []
+        previous = None
+        for bucket in buckets:
+            count = bucket[offset + 1]
+            if not count:
+                continue
+            tenths = min(1000, max(0, int(bucket[offset] * 10 / count + 0.5)))
+            path.append(("L" if bucket[0] == previous else "M") + str(round((bucket[0] - first_bucket) * x_step, 1))
+                        + " " + SPARK_Y[tenths])
+            previous = bucket[0] + 1
+        if path:
+            parts.append(f'<path d="{"".join(path)}" fill="none" stroke="#333" stroke-width="1.2"{dash}/>')
+    parts.append("</svg>")
+    return "".join(parts)
+
+
+def dashboard_panel(site, group, result, forecast, buckets, first_bucket, n_buckets):
+    """HTML of one site's panel: current values colored by band, forecasts and the sparkline."""
+    from html import escape
+    values = []
+    for volume in VOLUMES:
+        value = result.get(volume + "_free") if result else None
+        if value is None:
+            values.append(f'<span class="value missing">{volume} –</span>')
+            continue
+        note = format_forecast((forecast or {}).get(volume))
+        title = f' title="{escape(note)}"' if note else ""
+        values.append(f'<span class="value" style="background:{BAND_COLORS[get_color(value)]}"{title}>'
+                      f'{volume} {value}%</span>')
+    status = result.get("status", "ok") if result else "no result"
+    status_html = "" if status == "ok" else f' <span class="status">{escape(status)}</span>'
+    return (f'<div class="panel" id="site-{escape(site)}"><h3>{escape(site)} '
+            f'<small>{escape(group or "")}</small>{status_html}</h3>'
+            f'<div>{"".join(values)}</div>'
+            f'{sparkline_svg(buckets, first_bucket, n_buckets)}</div>')
+
+
+def prune_figures(output_path=None, now=None, keep=()):
+    """
+    Apply the figure retention policy to the output folder: keep every figure
+    from the last FIGURE_KEEP_ALL_DAYS days, only the last one of each day
+    until FIGURE_KEEP_DAILY_DAYS, and nothing older. Files in `keep` (the
+    current figure) are never removed. Returns the number of files deleted.
+    """
+    output_path = output_path or OUTPUT_FIGURE_PATH
+    now = datetime.fromtimestamp(now) if now is not None else datetime.now()
+    keep = {os.path.abspath(path) for path in keep}
+    try:
+        names = os.listdir(output_path)
+    except FileNotFoundError:
+        return 0
+    # Group the files of each figure (png/svg/json...) by their time stamp
+    figures = {}
+    for name in names:
+        match = FIGURE_NAME_PATTERN.match(name)
+        if match:
+            figures.setdefault(datetime.strptime(match.group(1), "%Y%m%d_%H%M"), []).append(name)
+    last_of_day = {}
+    for stamp in figures:
+        day = stamp.date()
+        if day not in last_of_day or stamp > last_of_day[day]:
+            last_of_day[day] = stamp
+    deleted = 0
+    for stamp, files in figures.items():
+        age_days = (now - stamp).total_seconds() / 86400
+        if age_days <= FIGURE_KEEP_ALL_DAYS:
+            continue
+        if age_days <= FIGURE_KEEP_DAILY_DAYS and last_of_day[stamp.date()] == stamp:
+            continue
+        for name in files:
+            path = os.path.join(output_path, name)
+            if os.path.abspath(path) not in keep:
+                os.remove(path)
+                deleted += 1
+    return deleted
+
+
+def build_dashboard(results, forecasts=None, now=None, directory=None, db_path=None):
+    """
+    Write a static HTML dashboard (index.html in DASHBOARD_PATH) with the latest
+    bar chart and a panel per site showing its current values and sparklines of
+    both volumes over the last DASHBOARD_WINDOW_DAYS.
+
+    Incremental: per-site history is kept as time-bucket sums in a state file,
+    and each build only reads the sites with rows written since the previous
+    one (by the history store's seq), newer than what their panel holds (summed
+    per bucket by SQLite). A site that got a row at or before its newest one (a
+    merged shard, --resume, replay --rebuild-history) is re-read over the whole
+    window instead. A panel's HTML is regenerated only when its site got new
+    data, its result changed or a bucket aged out of the window; the others are
+    reused from the state file. Old figures are then pruned (see prune_figures).
+    """
+    import shutil
+    from html import escape
+
+    start = time.perf_counter()
+    directory = directory or DASHBOARD_PATH
+    os.makedirs(directory, exist_ok=True)
+    now = time.time() if now is None else now
+    bucket_seconds = DASHBOARD_BUCKET_HOURS * 3600
+    n_buckets = int(DASHBOARD_WINDOW_DAYS * 86400 // bucket_seconds) + 1
+    first_bucket = int(now // bucket_seconds) - n_buckets + 1
+    window_start = first_bucket * bucket_seconds
+
+    state_path = os.path.join(directory, DASHBOARD_STATE_FILE)
+    try:
+        with open(state_path, "r") as f:
+            state = json.load(f)
+        if state.get("bucket_seconds") != bucket_seconds or "seq" not in state:
+            state = None
+    except (FileNotFoundError, json.JSONDecodeError):
+        state = None
+    state = state or {"bucket_seconds": bucket_seconds, "seq": None, "sites": {}}
+
+    inventory = load_site_inventory()
+    latest = {r["site"]: r for r in results}
+    sites = [site for site in inventory.names if site in latest or site in state["sites"]]
+    sites += [site for site in latest if site not in inventory.by_name]
+
+    regenerated = 0
+    conn = open_history(db_path)
+    try:
+        # Read before the buckets: a row written in between is then seen again next time
+        newest_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM storage_history").fetchone()[0]
+        changes = None if state["seq"] is None else history_changes(conn, state["seq"])
+        for site in sites:
+            if site not in state["sites"]:
+                state["sites"][site] = {"last_ts": 0, "seq": 0, "buckets": [], "key": None, "html": ""}
+                change = (0, newest_seq)
+            else:
+                change = (0, newest_seq) if changes is None else changes.get(site)
+            entry = state["sites"][site]
+            buckets = {b[0]: b for b in entry["buckets"] if b[0] >= first_bucket}
+            if change:
+                if change[0] <= entry["last_ts"]:
+                    # Rows landed among those already summed: start over
+                    buckets = {}
+                    entry["last_ts"] = 0
+                for row in history_buckets(conn, site, max(entry["last_ts"], window_start - 1), bucket_seconds):
+                    old = buckets.get(row[0], [row[0], 0, 0, 0, 0])
+                    buckets[row[0]] = [row[0], old[1] + row[1], old[2] + row[2], old[3] + row[3], old[4] + row[4]]
+                    entry["last_ts"] = max(entry["last_ts"], row[5])
+                entry["seq"] = change[1]
+            entry["buckets"] = [buckets[b] for b in sorted(buckets)]
+
+            result = latest.get(site)
+            forecast = (forecasts or {}).get(site)
+            key = json.dumps([entry["seq"], entry["last_ts"], first_bucket, result and [result["internal_free"],
+                              result["external_free"], result.get("status")],
+                              [format_forecast((forecast or {}).get(v)) for v in VOLUMES]])
+            if key != entry["key"]:
+                entry["html"] = dashboard_panel(site, inventory.lookup(site).group, result, forecast,
+                                                entry["buckets"], first_bucket, n_buckets)
+                entry["key"] = key
+                regenerated += 1
+        state["seq"] = newest_seq
+    finally:
+        conn.close()
+
+    # The current bar chart, copied so the dashboard folder can be served on its own
+    figure_html = ""
+    try:
+        with open(os.path.join(OUTPUT_FIGURE_PATH, RENDER_CACHE_FILE), "r") as f:
+            figure_files = json.load(f)["files"]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        figure_files = []
+    for path in figure_files:
+        ext = os.path.splitext(path)[1]
+        if ext in (".svg", ".png") and os.path.exists(path):
+            shutil.copyfile(path, os.path.join(directory, "latest" + ext))
+            figure_html = f'<img class="figure" src="latest{ext}?v={int(os.path.getmtime(path))}" alt="Storage bar chart">'
+            if ext == ".svg":
+                break
+
+    panels = []
+    group = None
+    for site in sites:
+        site_group = inventory.lookup(site).group
+        if site_group != group or not panels:
+            if panels:
+                panels.append("</div>")
+            panels.append(f'<h2>{escape(site_group or "Other")}</h2><div class="grid">')
+            group = site_group
+        panels.append(state["sites"][site]["html"])
+    if panels:
+        panels.append("</div>")
+    updated = datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S")
+    page = (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>MARACOOS Storage Space</title>'
+            f'<meta http-equiv="refresh" content="300"><style>'
+            f'body{{font-family:sans-serif;margin:1em;}} .figure{{max-width:100%;}}'
+            f'.grid{{display:flex;flex-wrap:wrap;gap:8px;}} .panel{{border:1px solid #ccc;padding:6px;width:250px;}}'
+            f'.panel h3{{margin:0 0 4px;font-size:1em;}} .value{{color:#fff;padding:1px 4px;margin-right:4px;font-size:.85em;}}'
+            f'.missing{{background:#999;}} .status{{color:#c62828;font-size:.8em;}}'
+            f'</style></head><body><h1>RUCODAR Site Computer Storage Space</h1>'
+            f'<p>Updated {updated}. Sparklines: last {DASHBOARD_WINDOW_DAYS} days, internal solid, external dashed.</p>'
+            f'{figure_html}{"".join(panels)}</body></html>')
+    for path, content in ((os.path.join(directory, "index.html"), page), (state_path, json.dumps(state))):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    pruned = prune_figures(now=now, keep=figure_files)
+    print(f"Dashboard: {len(sites)} panels ({regenerated} regenerated), {pruned} old figure files pruned, "
+          f"built in {(time.perf_counter() - start) * 1000:.0f} ms -> {os.path.join(directory, 'index.html')}")
+
+
+######################
+# Watch mode
+######################
+
+def poll_interval(result, forecasts=None):
+    """
+    Seconds until a site should be polled again in --watch mode: often when a
+    volume is in the orange/red bands or heading for red quickly, less often in
+    the yellow band or while slowly filling, and rarely when green and stable.
+    Failed collections are retried at the base interval.
+    """
+    if result is None or result.get("status") != "ok":
+        return WATCH_BASE_INTERVAL
+    values = [v for v in (result["internal_free"], result["external_free"]) if v is not None]
+    site_forecast = (forecasts or {}).get(result["site"], {})
+    days_to_red = [f["days_to_red"] for f in site_forecast.values()
+                   if f and f["days_to_red"] is not None]
+    soonest = min(days_to_red) if days_to_red else None
+
+    if min(values) < YELLOW_THRESHOLD or (soonest is not None and soonest < WATCH_FAST_FILL_DAYS):
+        return WATCH_MIN_INTERVAL
+    if min(values) < GREEN_THRESHOLD or (soonest is not None and soonest < WATCH_SLOW_FILL_DAYS):
+        return WATCH_BASE_INTERVAL
+    return WATCH_MAX_INTERVAL
+
+
+def watch_poll_site(driver, site, site_tabs):
+    """
+    Poll one site in --watch mode, reusing the tab (and session) left open by
+    the previous poll. If the reused tab no longer yields storage data the
+    session probably expired, so log in again in a fresh tab.
+    """
+    if site not in password_dict:
+        print(f"No password found for site {site}; skipping.")
+        return None
+
+    handle = site_tabs.get(site)
+    if handle in driver.window_handles:
+        print(f"Polling site: {site} (reusing tab)")
+        driver.switch_to.window(handle)
+        internal_free, external_free = get_storage_info(driver, site)
+        if internal_free is not None or external_free is not None:
+            return make_result(site, internal_free, external_free)
+        driver.close()
+        driver.switch_to.window(driver.window_handles[0])
+    site_tabs.pop(site, None)
+
+    print(f"Accessing site: {site}")
+    if not login_and_navigate(driver, site, password_dict[site]):
+        # Don't keep a dead tab around between polls
+        if len(driver.window_handles) > 1:
+            driver.close()
+            driver.switch_to.window(driver.window_handles[0])
+        return make_result(site, None, None, status="login_failed")
+    site_tabs[site] = driver.current_window_handle
+    internal_free, external_free = get_storage_info(driver, site)
+    return make_result(site, internal_free, external_free)
+
+
+def watch(backend, record=True, render=True, alerts=True):
+    """
+    Run as a daemon: keep one browser session with a logged-in tab per site
+    (recycled by DriverManager when it grows too large),
+    poll each site when it is due (see poll_interval), and after every cycle
+    record history, reprint the summary and send alerts (and regenerate the
+    figure if `render`). Stops on Ctrl-C.
+    """
+    manager = DriverManager(headless=HEADLESS)
+    site_tabs = {}
+    latest = {}
+    health = load_site_health()
+    inventory = load_site_inventory()
+    # Sites that fall due together are polled highest priority first
+    rank = {site: i for i, site in enumerate(inventory.collection_order())}
+    schedule = [(time.time(), site) for site in rank]
+    heapq.heapify(schedule)
+    print(f"Watching {len(schedule)} sites (Ctrl-C to stop)")
+
+    try:
+        while schedule:
+            now = time.time()
+            if schedule[0][0] > now:
+                time.sleep(min(schedule[0][0] - now, 60))
+                continue
+            due = []
+            while schedule and schedule[0][0] <= now:
+                due.append(heapq.heappop(schedule)[1])
+            due.sort(key=rank.get)
+            due, skipped = check_circuits(due, health, now)
+            if result_sink is not None:
+                result_sink.start_run(now)
+            for result in skipped:
+                latest[result["site"]] = result
+                heapq.heappush(schedule, (max(health[result["site"]]["open_until"],
+                                              now + WATCH_MIN_INTERVAL), result["site"]))
+
+            if backend == 'http':
+                polled = collect_http(due, HTTP_CONCURRENCY)
+            else:
+                from selenium.common.exceptions import WebDriverException
+                polled = []
+                for site in due:
+                    if manager.driver is None:
+                        site_tabs.clear()
+                    try:
+                        previous_tab = site_tabs.get(site)
+                        result = watch_poll_site(manager.get(), site, site_tabs)
+                        # Only logins into a new tab count towards recycling the browser;
+                        # re-polling the kept tabs would otherwise restart it every few cycles
+                        new_tab = site_tabs.get(site) not in (None, previous_tab)
+                        manager.site_done(keep_tabs=site_tabs.values(), new_tab=new_tab)
+                    except WebDriverException as e:
+                        # The browser died; start a new one on the next site
+                        print(f"[{site}] WebDriver error, restarting browser: {e.__class__.__name__}")
+                        manager.recycle("WebDriver error")
+                        result = make_result(site, None, None, status="error")
+                    if result is not None:
+                        stream_result(result)
+                        polled.append(result)
+
+            update_site_health(health, polled, now)
+            save_site_health(health)
+            for result in polled:
+                latest[result["site"]] = result
+            results = [latest[site] for site in inventory.names if site in latest]
+            forecasts = publish_results(polled, results, now, record=record, render=render, alerts=alerts)
+
+            polled_sites = {r["site"] for r in polled}
+            for site in due:
+                if site in polled_sites:
+                    delay = poll_interval(latest.get(site), forecasts)
+                    if health.get(site, {}).get("open_until"):
+                        delay = max(delay, health[site]["open_until"] - now)
+                    heapq.heappush(schedule, (now + delay, site))
+                    if DEBUG_MODE:
+                        print(f"[{site}] Next poll in {delay / 60:.0f} min")
+    except KeyboardInterrupt:
+        print("Stopping watch.")
+    finally:
+        manager.quit()
+
+
+######################
+# Collector settings
+######################
+
+# configure_collection setting -> the module global it sets
+COLLECTION_SETTINGS = {"username": "username", "passwords": "password_dict", "url_template": "rws_url_template",
+                       "cookie_path": "COOKIE_PATH", "lean": "LEAN_MODE"}
+
+
+def configure_collection(**settings):
+    """
+    Set what the collectors run with, for main() and for code that drives them
+    from outside (bench.py, the tests): `username`, `passwords` ({site:
+    password}), `url_template` (see rws_url_template), `cookie_path` and
+    `lean`. Giving `cookie_path`, even the current one, drops the loaded
+    session cache so it is read again from that folder. Returns the previous
+    values of the given settings; pass them back to restore them.
+    """
+    global session_cache, session_dirty
+    unknown = set(settings) - set(COLLECTION_SETTINGS)
+    if unknown:
+        raise TypeError(f"Unknown collection settings: {', '.join(sorted(unknown))}")
+    module_globals = globals()
+    previous = {}
+    for setting, value in settings.items():
+        previous[setting] = module_globals[COLLECTION_SETTINGS[setting]]
+        module_globals[COLLECTION_SETTINGS[setting]] = value
+    if "cookie_path" in settings:
+        with session_lock:
+            session_cache = None
+            session_dirty = False
+    return previous
+
+
+def reset_run_stats():
+    """Forget the phase timings, page traffic and counters gathered so far (between benchmark runs)."""
+    phase_timings.clear()
+    timed_out_sites.clear()
+    page_stats.clear()
+    rpc_savings.clear()
+    driver_stats.update(peak_rss_mb=0.0, recycles=0, tabs_closed=0)
+    session_stats.update(hit=0, miss=0, expired=0)
+
+
+COMMANDS = ('run', 'collect', 'merge', 'render', 'dashboard', 'replay', 'bench', 'fake-server')
+
+
+def parse_args(argv=None):
+    """
+    Parse the command line. Subcommands:
+      run      collect and render (the default when no subcommand is given)
+      collect  poll the sites and save results/history, without drawing
+      merge    combine the partial results of `collect --shard i/N` runs
+      render   draw the figure from saved results or history
+      dashboard  rebuild the HTML dashboard from saved results and history
+      replay   re-parse the archived /details pages offline
+      bench    benchmarks (see --help)
+      fake-server  run a local stand-in Radial Suite server to collect against
+    """
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--debug', action='store_true',
+                       help='Enable debug mode for detailed output')
+    common.add_argument('--profile', action='store_true',
+                       help='Run under cProfile and save the stats next to the figure (OUTPUT_FIGURE_PATH)')
+
+    collect_opts = argparse.ArgumentParser(add_help=False)
+    collect_opts.add_argument('--refresh-cookies', action='store_true',
+                       help='Force refresh of all cookies by deleting existing ones')
+    collect_opts.add_argument('--workers', type=int, default=1,
+                       help='Number of concurrent WebDriver sessions used to poll sites (default: 1)')
+    collect_opts.add_argument('--backend', choices=['selenium', 'http'], default='selenium',
+                       help='Collector backend; "http" skips the browser and falls back to Selenium per failed site')
+    collect_opts.add_argument('--no-history', action='store_true',
+                       help='Do not append this run to the history database')
+    collect_opts.add_argument('--watch', action='store_true',
+                       help='Keep running: poll each site on its own adaptive schedule')
+    collect_opts.add_argument('--resume', action='store_true',
+                       help='Skip sites that already have a fresh successful result in the result stream')
+    collect_opts.add_argument('--resume-window', type=float, default=None, metavar='MINUTES',
+                       help='How recent a streamed result must be for --resume (default: RESUME_WINDOW_MINUTES)')
+    collect_opts.add_argument('--lean', action='store_true',
+                       help='Block images, fonts and stylesheets and use eager page loads in Chrome')
+    collect_opts.add_argument('--no-alerts', action='store_true',
+                       help='Do not evaluate or send alerts for this run (see ALERT_SINKS)')
+    collect_opts.add_argument('--archive', action='store_true',
+                       help='Save every fetched /details page to the page archive (ARCHIVE_PATH)')
+    collect_opts.add_argument('--shard', type=parse_shard, metavar='I/N',
+                       help='Only collect shard I of N (sites split by a hash of their name) and save a '
+                            'partial result file for `merge`; history and the figure are left to `merge`')
+    collect_opts.add_argument('--url-template',
+                       help="Override the site URL, e.g. 'http://127.0.0.1:8240/{site}' for a local stand-in server")
+
+    render_opts = argparse.ArgumentParser(add_help=False)
+    render_opts.add_argument('--formats', type=lambda value: [f.strip().lower() for f in value.split(',') if f.strip()],
+                       help="Comma-separated figure outputs from png, svg, pdf and json (default: FIGURE_FORMATS)")
+    render_opts.add_argument('--no-render-cache', action='store_true',
+                       help='Redraw the figure even if the results are unchanged since the last one')
+    render_opts.add_argument('--dashboard', action='store_true',
+                       help='Also update the HTML dashboard in DASHBOARD_PATH and prune old figures')
+
+    fake_opts = argparse.ArgumentParser(add_help=False)
+    fake_opts.add_argument('--latency', type=float, default=0.05, metavar='SECONDS',
+                       help='Fake server: delay added to every response (default: 0.05)')
+    fake_opts.add_argument('--jitter', type=float, default=0.0, metavar='SECONDS',
+                       help='Fake server: random +/- variation of the latency (default: 0)')
+    fake_opts.add_argument('--timeout-rate', type=float, default=0.0, metavar='FRACTION',
+                       help='Fake server: share of sites that stall every response by --hang seconds')
+    fake_opts.add_argument('--hang', type=float, default=30.0, metavar='SECONDS',
+                       help='Fake server: how long a stalling site holds each response (default: 30)')
+    fake_opts.add_argument('--login-failure-rate', type=float, default=0.0, metavar='FRACTION',
+                       help='Fake server: share of sites that reject every login')
+    fake_opts.add_argument('--seed', type=int, default=0,
+                       help='Fake server: seed for per-site layouts, values and faults (default: 0)')
+
+    parser = argparse.ArgumentParser(description='MARACOOS Storage Space Monitor')
+    subparsers = parser.add_subparsers(dest='command', metavar='{' + ','.join(COMMANDS) + '}')
+    subparsers.add_parser('run', parents=[common, collect_opts, render_opts],
+                          help='Collect storage info and render the figure (default)')
+    subparsers.add_parser('collect', parents=[common, collect_opts],
+                          help='Collect storage info and save results, without rendering')
+    dashboard_parser = subparsers.add_parser('dashboard', parents=[common],
+                                             help='Rebuild the HTML dashboard without drawing a new figure')
+    dashboard_parser.add_argument('--input',
+                       help='Results file written by collect (default: RESULTS_FILE)')
+    dashboard_parser.add_argument('--full', action='store_true',
+                       help='Rebuild every panel from the whole history window')
+    merge_parser = subparsers.add_parser('merge', parents=[common, render_opts],
+                                         help='Combine shard result files, record history and render')
+    merge_parser.add_argument('paths', nargs='*',
+                       help='Shard result files (default: every shard file next to RESULTS_FILE)')
+    merge_parser.add_argument('--strict', action='store_true',
+                       help='Exit with an error instead of merging if shards or sites are missing or duplicated')
+    merge_parser.add_argument('--no-history', action='store_true',
+                       help='Do not append the merged results to the history database')
+    merge_parser.add_argument('--no-render', action='store_true',
+                       help='Save the merged results and print the summary without drawing the figure')
+    merge_parser.add_argument('--no-alerts', action='store_true',
+                       help='Do not evaluate or send alerts for the merged results')
+    render_parser = subparsers.add_parser('render', parents=[common, render_opts],
+                                          help='Render the figure from saved results')
+    render_parser.add_argument('--input',
+                       help='Results file written by collect (default: RESULTS_FILE)')
+    render_parser.add_argument('--as-of', type=datetime.fromisoformat,
+                       help="Render the history as of a time instead, e.g. '2025-01-27 12:00'")
+    replay_parser = subparsers.add_parser('replay', parents=[common],
+                                          help='Re-run storage extraction over the page archive')
+    replay_parser.add_argument('--path',
+                       help='Archive directory (default: ARCHIVE_PATH)')
+    replay_parser.add_argument('--site',
+                       help='Only replay pages from this site')
+    replay_parser.add_argument('--since', type=datetime.fromisoformat,
+                       help="Only replay pages captured from this time, e.g. '2025-01-27'")
+    replay_parser.add_argument('--workers', type=int, default=None,
+                       help='Parser processes (default: one per CPU core)')
+    replay_parser.add_argument('--rebuild-history', action='store_true',
+                       help='Overwrite the history rows of the archived runs with the replayed results')
+    bench_parser = subparsers.add_parser('bench', parents=[common, fake_opts], help='Run benchmarks')
+    bench_parser.add_argument('suite', choices=['startup', 'collectors', 'micro'],
+                       help='startup: time --help/collect/render start-up against eager imports; '
+                            'collectors: run each collector mode against the fake server; '
+                            'micro: time the parsing, figure and credentials hot paths against a stored baseline')
+    bench_parser.add_argument('--repeat', type=int, default=5,
+                       help='Runs per measurement (default: 5)')
+    bench_parser.add_argument('--save-baseline', action='store_true',
+                       help='micro: store these timings as the baseline later runs are checked against')
+    bench_parser.add_argument('--record-inputs', action='store_true',
+                       help='micro: re-record the inputs from the page archive and latest results')
+    bench_parser.add_argument('--sites', type=int, default=None,
+                       help='collectors: number of fake sites (default: as many as the inventory)')
+    bench_parser.add_argument('--modes',
+                       help="collectors: comma-separated modes out of http, http-warm, selenium, selenium-lean "
+                            "and selenium-workers (default: all of them)")
+    bench_parser.add_argument('--workers', type=int, default=4,
+                       help='collectors: WebDriver sessions for the selenium-workers mode (default: 4)')
+    bench_parser.add_argument('--output',
+                       help='collectors: also write the report as JSON to this file')
+    fake_parser = subparsers.add_parser('fake-server', parents=[common, fake_opts],
+                                        help='Serve fake Radial Suite sites locally for testing')
+    fake_parser.add_argument('--host', default='127.0.0.1',
+                       help='Address to listen on (default: 127.0.0.1)')
+    fake_parser.add_argument('--port', type=int, default=8240,
+                       help='Port to listen on, 0 for any free port (default: 8240)')
+    fake_parser.add_argument('--password',
+                       help='Only accept this password (default: any non-empty password)')
+
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # Keep the old flag-only invocation working: no subcommand means "run"
+    if not any(arg in COMMANDS for arg in argv) and not ({'-h', '--help'} & set(argv)):
+        argv = ['run'] + argv
+    return parser.parse_args(argv)
+
+
+def bench_startup(repeat=5):
+    """
+    Time how long the script takes to start for commands that should stay light,
+    against a child process that only performs the old eager imports.
+    """
+    script = os.path.abspath(__file__)
+    cases = [
+        ("--help", [sys.executable, script, "--help"]),
+        ("collect --help", [sys.executable, script, "collect", "--help"]),
+        ("render --help", [sys.executable, script, "render", "--help"]),
+        ("eager selenium+matplotlib+numpy imports", [
+            sys.executable, "-c",
+            "import selenium.webdriver, matplotlib; matplotlib.use('Agg'); "
+            "import matplotlib.pyplot, numpy"]),
+    ]
+    print(f"Start-up time over {repeat} runs (median / min):")
+    for label, cmd in cases:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            completed = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            times.append(time.perf_counter() - start)
+        status = "" if completed.returncode == 0 else f"  (exit code {completed.returncode})"
+        print(f"  {label:42s} {statistics.median(times) * 1000:7.0f} ms / {min(times) * 1000:5.0f} ms{status}")
+
+
+def fake_server_options(args):
+    """The make_fake_server keyword arguments given on the command line."""
+    return {"latency": args.latency, "jitter": args.jitter, "timeout_rate": args.timeout_rate,
+            "login_failure_rate": args.login_failure_rate, "hang_seconds": args.hang,
+            "seed": args.seed}
+
+
+PROFILE_NAME_PATTERN = re.compile(r"^MARACOOS_Profile_(\d{8}_\d{4})\.prof$")
+
+
+def prune_profiles(output_path=None, now=None, keep=()):
+    """
+    Delete the --profile stats in the output folder that are older than
+    PROFILE_KEEP_DAYS, except those in `keep`. Returns the number deleted.
+    """
+    output_path = output_path or OUTPUT_FIGURE_PATH
+    now = datetime.fromtimestamp(now) if now is not None else datetime.now()
+    keep = {os.path.abspath(path) for path in keep}
+    try:
+        names = os.listdir(output_path)
+    except FileNotFoundError:
+        return 0
+    deleted = 0
+    for name in names:
+        match = PROFILE_NAME_PATTERN.match(name)
+        if not match:
+            continue
+        path = os.path.join(output_path, name)
+        age_days = (now - datetime.strptime(match.group(1), "%Y%m%d_%H%M")).total_seconds() / 86400
+        if age_days > PROFILE_KEEP_DAYS and os.path.abspath(path) not in keep:
+            os.remove(path)
+            deleted += 1
+    return deleted
+
+
+def profile_call(function, *args):
+    """
+    Run function(*args) under cProfile, then save the stats next to the figure
+    (MARACOOS_Profile_<time>.prof in OUTPUT_FIGURE_PATH, kept for
+    PROFILE_KEEP_DAYS; see prune_profiles) and print the most expensive calls.
+    Explore the file with `python -m pstats` or a viewer such as snakeviz.
+    """
+    import cProfile
+    import pstats
+
+    path = f"{OUTPUT_FIGURE_PATH}/MARACOOS_Profile_{datetime.now().strftime('%Y%m%d_%H%M')}.prof"
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args)
+    finally:
+        os.makedirs(OUTPUT_FIGURE_PATH, exist_ok=True)
+        profiler.dump_stats(path)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+        print(f"Saved profile to {path}")
+        deleted = prune_profiles(keep=[path])
+        if deleted:
+            print(f"Deleted {deleted} profiles older than {PROFILE_KEEP_DAYS} days")
+
+
+def main():
+    # Parse command line arguments
+    args = parse_args()
+    if args.profile:
+        profile_call(run_command, args)
+    else:
+        run_command(args)
+
+
+def run_command(args):
+    """Run the subcommand parsed into `args`."""
+    # Set global debug mode
+    global DEBUG_MODE
+    DEBUG_MODE = args.debug
+
+    global FIGURE_FORMATS, RENDER_CACHE
+    if getattr(args, 'formats', None):
+        unknown = set(args.formats) - {'png', 'svg', 'pdf', 'json'}
+        if unknown:
+            print(f"Error: Unknown figure formats: {', '.join(sorted(unknown))}")
+            sys.exit(1)
+        FIGURE_FORMATS = args.formats
+    RENDER_CACHE = RENDER_CACHE and not getattr(args, 'no_render_cache', False)
+    global DASHBOARD
+    DASHBOARD = DASHBOARD or getattr(args, 'dashboard', False)
+
+    if args.command == 'dashboard':
+        if args.full:
+            state_path = os.path.join(DASHBOARD_PATH, DASHBOARD_STATE_FILE)
+            if os.path.exists(state_path):
+                os.remove(state_path)
+        render(args.input, dashboard_only=True)
+        return
+
+    if args.command == 'render':
+        render(args.input, args.as_of)
+        return
+    if args.command == 'merge':
+        if not merge(args.paths, args.strict, record=not args.no_history, render=not args.no_render,
+                     alerts=not args.no_alerts) and args.strict:
+            sys.exit(1)
+        return
+    if args.command == 'replay':
+        replay(args.path, args.site, args.since, args.workers, args.rebuild_history)
+        return
+    if args.command == 'bench':
+        if args.suite == 'collectors':
+            import bench
+            modes = ([m.strip() for m in args.modes.split(',') if m.strip()] if args.modes
+                     else list(bench.BENCH_COLLECTOR_MODES))
+            n_sites = args.sites or len(load_site_inventory().names)
+            bench.bench_collectors(sys.modules[__name__], n_sites, modes, args.workers,
+                                   fake_server_options(args), args.output)
+        elif args.suite == 'micro':
+            import bench
+            if not bench.bench_micro(sys.modules[__name__], args.repeat, args.save_baseline, args.record_inputs):
+                sys.exit(1)
+        else:
+            bench_startup(args.repeat)
+        return
+    if args.command == 'fake-server':
+        from fake_radial_suite import serve_fake_radial_suite
+        serve_fake_radial_suite(args.host, args.port, password=args.password, verbose=DEBUG_MODE,
+                                **fake_server_options(args))
+        return
+
+    # Load credentials only when we are going to collect
+    user, passwords = load_credentials()
+    configure_collection(username=user, passwords=passwords)
+    print(f"Loaded credentials for {len(passwords)} sites")
+
+    if args.url_template:
+        configure_collection(url_template=args.url_template)
+    if args.lean:
+        configure_collection(lean=True)
+
+    # A shard keeps its own session cache, circuit state and result file
+    global shard
+    shard = args.shard
+    if shard and args.watch:
+        print("Error: --shard cannot be combined with --watch")
+        sys.exit(1)
+
+    # Handle cookie refresh
+    if args.refresh_cookies:
+        cookie_files = glob.glob(f"{COOKIE_PATH}/*.pkl") + glob.glob(session_cache_path())
+        for cookie_file in cookie_files:
+            os.remove(cookie_file)
+        print(f"Deleted {len(cookie_files)} existing cookie files. Will create fresh ones.")
+
+    # Ensure cookie directory exists
+    os.makedirs(COOKIE_PATH, exist_ok=True)
+
+    # Stream each site's result to disk as soon as it is collected
+    global result_sink
+    run_ts = time.time()
+    result_sink = ResultSink(run_ts)
+    if args.archive or ARCHIVE_PAGES:
+        global page_archive
+        page_archive = PageArchive()
+
+    render_figure = args.command == 'run' and not shard
+    if args.watch:
+        watch(args.backend, record=not args.no_history, render=render_figure, alerts=not args.no_alerts)
+        return
+
+    inventory = load_site_inventory()
+    sites = inventory.collection_order()
+    if shard:
+        sites = [site for site in sites if shard_of(site, shard[1]) == shard[0]]
+        print(f"Collecting shard {shard[0]}/{shard[1]}: {len(sites)} sites")
+
+    # Skip sites whose circuit is open after repeated timeouts
+    health = load_site_health()
+    runnable, skipped = check_circuits(sites, health, run_ts)
+
+    # With --resume, reuse results a crashed or interrupted run already streamed
+    resumed = {}
+    if args.resume:
+        window = RESUME_WINDOW_MINUTES if args.resume_window is None else args.resume_window
+        resumed = {site: r for site, r in load_fresh_results(window, run_ts).items() if site in sites}
+        runnable = [site for site in runnable if site not in resumed]
+        print(f"Resuming: {len(resumed)} sites have a result from the last {window:.0f} min; "
+              f"{len(runnable)} left to collect")
+
+    # For each site, login and gather storage stats
+    if args.backend == 'http':
+        results = collect_http(runnable, HTTP_CONCURRENCY, workers=args.workers)
+    elif args.workers > 1:
+        results = collect_concurrent(runnable, args.workers)
+    else:
+        results = collect_sequential(runnable)
+
+    update_site_health(health, results, run_ts)
+    save_site_health(health)
+    results = merge_in_site_order(inventory.names, results, skipped, resumed.values())
+
+    if shard:
+        # History, forecasts and the figure are produced by `merge`
+        publish_results(results, results, run_ts, record=False, render=False, forecast=False,
+                        metadata=shard_metadata(run_ts, sites, args.backend), alerts=False)
+        return
+    publish_results(results, results, run_ts, record=not args.no_history,
+                    render=render_figure, forecast=render_figure, alerts=not args.no_alerts)
 
 
 if __name__ == "__main__":
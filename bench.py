@@ -0,0 +1,358 @@
+"""
+Benchmarks for the MARACOOS storage monitor, run through its `bench` command.
+Kept out of the monitor script so the cron job never loads them; every
+function takes the monitor's module (`monitor`) and drives it through its
+public helpers.
+"""
+
+import io
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime
+
+from fake_radial_suite import fake_site_names
+
+
+# Collector modes measured by `bench collectors`, in the order they run.
+# http-warm reuses the sessions http just cached; the others start logged out.
+BENCH_COLLECTOR_MODES = ('http', 'http-warm', 'selenium', 'selenium-lean', 'selenium-workers')
+
+
+@contextmanager
+def track_peak_rss(process_tree_rss_mb, exclude=(), interval=0.25):
+    """
+    Sample the resident memory of this process and its children (browsers
+    included, the `exclude` pids not) while the block runs, measured with the
+    monitor's `process_tree_rss_mb`. Yields a dict that ends up holding
+    baseline_mb and peak_mb.
+    """
+    usage = {"baseline_mb": process_tree_rss_mb(os.getpid(), exclude) or 0.0}
+    usage["peak_mb"] = usage["baseline_mb"]
+    stop = threading.Event()
+
+    def sample():
+        while not stop.wait(interval):
+            rss = process_tree_rss_mb(os.getpid(), exclude)
+            if rss is not None:
+                usage["peak_mb"] = max(usage["peak_mb"], rss)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        yield usage
+    finally:
+        stop.set()
+        sampler.join()
+
+
+def latency_percentiles(seconds):
+    """p50/p90/p99 of a list of durations, in milliseconds."""
+    if len(seconds) < 2:
+        return {"p50": seconds[0] * 1000, "p90": seconds[0] * 1000, "p99": seconds[0] * 1000}
+    cuts = statistics.quantiles(seconds, n=100, method='inclusive')
+    return {"p50": cuts[49] * 1000, "p90": cuts[89] * 1000, "p99": cuts[98] * 1000}
+
+
+def run_collector_mode(monitor, mode, sites, workers):
+    """Collect `sites` with one benchmark mode; returns the results (None for a site that raised)."""
+    if mode in ('http', 'http-warm'):
+        import asyncio
+        results, _ = asyncio.run(monitor.collect_http_async(sites, monitor.HTTP_CONCURRENCY))
+        return results
+    previous = monitor.configure_collection(lean=mode == 'selenium-lean')
+    try:
+        if mode == 'selenium-workers':
+            return monitor.collect_concurrent(sites, workers)
+        return monitor.collect_sequential(sites)
+    finally:
+        monitor.configure_collection(**previous)
+
+
+def bench_collectors(monitor, n_sites, modes, workers, server_options, output=None):
+    """
+    Start the fake Radial Suite server in a child process and collect `n_sites`
+    fake sites with each mode in `modes` (see BENCH_COLLECTOR_MODES), reporting
+    sites/minute, per-phase latency percentiles and peak memory of this process
+    plus its browsers. The server runs in its own process so it neither shares
+    the GIL with the collector nor counts towards its memory.
+    `monitor` is the monitor script's module; the collectors are pointed at
+    the server with its configure_collection and restored afterwards.
+    Collector output is silenced unless --debug is given.
+    """
+    unknown = [m for m in modes if m not in BENCH_COLLECTOR_MODES]
+    if unknown:
+        print(f"Error: Unknown collector modes: {', '.join(unknown)}")
+        sys.exit(1)
+
+    sites = fake_site_names(n_sites, monitor.load_site_inventory().names)
+
+    cmd = [sys.executable, os.path.abspath(monitor.__file__), "fake-server", "--port", "0",
+           "--password", "bench"]
+    option_flags = {"latency": "--latency", "jitter": "--jitter", "timeout_rate": "--timeout-rate",
+                    "login_failure_rate": "--login-failure-rate", "hang_seconds": "--hang",
+                    "seed": "--seed"}
+    for name, flag in option_flags.items():
+        cmd += [flag, str(server_options[name])]
+    server = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    first_line = server.stdout.readline()
+    match = re.search(r"(http://\S+)", first_line)
+    if not match:
+        server.kill()
+        print(f"Error: Fake server did not start: {first_line!r}")
+        sys.exit(1)
+
+    print(f"Benchmarking {len(sites)} fake sites at {match.group(1)} "
+          f"(latency {server_options['latency'] * 1000:.0f} ms, timeout rate {server_options['timeout_rate']:.0%}, "
+          f"login failure rate {server_options['login_failure_rate']:.0%})")
+    cookie_dir = tempfile.mkdtemp(prefix="bench_cookies_")
+    previous = monitor.configure_collection(username="bench", passwords={site: "bench" for site in sites},
+                                            url_template=match.group(1) + "/{site}", cookie_path=cookie_dir)
+    report = {"run": datetime.now().isoformat(timespec="seconds"), "sites": len(sites),
+              "server": server_options, "modes": {}}
+    browser_error = None
+    if any(mode.startswith('selenium') for mode in modes):
+        # Check once, outside the timings, that Chrome can start at all
+        try:
+            with redirect_stdout(io.StringIO()):
+                monitor.create_webdriver(headless=monitor.HEADLESS).quit()
+        except Exception as e:
+            browser_error = f"{e.__class__.__name__}: {str(e).strip().splitlines()[0] if str(e).strip() else ''}"
+    try:
+        for mode in modes:
+            if mode.startswith('selenium') and browser_error:
+                print(f"  {mode:17s} skipped ({browser_error})")
+                report["modes"][mode] = {"error": browser_error}
+                continue
+            if mode != 'http-warm':
+                # Start logged out
+                shutil.rmtree(cookie_dir, ignore_errors=True)
+                monitor.configure_collection(cookie_path=cookie_dir)
+            monitor.reset_run_stats()
+
+            sink = sys.stdout if monitor.DEBUG_MODE else io.StringIO()
+            start = time.perf_counter()
+            with track_peak_rss(monitor.process_tree_rss_mb, exclude={server.pid}) as usage, redirect_stdout(sink):
+                results = run_collector_mode(monitor, mode, sites, workers)
+            wall = time.perf_counter() - start
+            ok = sum(1 for r in results if r is not None and r["status"] == "ok")
+            by_phase = {}
+            for record in monitor.phase_timings:
+                by_phase.setdefault(record["phase"], []).append(record["seconds"])
+            report["modes"][mode] = {
+                "seconds": round(wall, 3),
+                "sites_per_minute": round(len(sites) / wall * 60, 1),
+                "ok": ok,
+                "failed": len(sites) - ok,
+                "peak_rss_mb": round(usage["peak_mb"], 1),
+                "rss_growth_mb": round(usage["peak_mb"] - usage["baseline_mb"], 1),
+                "phases": {phase: dict(count=len(values), **{k: round(v, 1) for k, v in
+                                                             latency_percentiles(values).items()})
+                           for phase, values in by_phase.items()},
+            }
+    finally:
+        server.terminate()
+        server.wait()
+        # Back to the real cookie folder; nothing is flushed into the deleted one at exit
+        monitor.configure_collection(**previous)
+        shutil.rmtree(cookie_dir, ignore_errors=True)
+
+    print(f"\n{'Mode':17s} {'sites/min':>9s} {'seconds':>8s} {'ok':>6s} {'failed':>6s} {'peak RSS MB':>11s} {'growth MB':>9s}")
+    for mode, stats in report["modes"].items():
+        if "error" in stats:
+            continue
+        print(f"{mode:17s} {stats['sites_per_minute']:9.1f} {stats['seconds']:8.2f} {stats['ok']:6d} "
+              f"{stats['failed']:6d} {stats['peak_rss_mb']:11.1f} {stats['rss_growth_mb']:9.1f}")
+    for mode, stats in report["modes"].items():
+        if stats.get("phases"):
+            print(f"\n{mode} phase latency (ms):")
+            for phase, p in stats["phases"].items():
+                print(f"  {phase:18s} n={p['count']:<6d} p50 {p['p50']:8.1f}  p90 {p['p90']:8.1f}  p99 {p['p99']:8.1f}")
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {output}")
+    return report
+
+
+def micro_data_paths(monitor):
+    """
+    The (inputs, baseline) files `bench micro` reads: the local ones next to the
+    script first, then the reference copies committed in BENCH_REFERENCE_DIR.
+    """
+    script_dir = os.path.dirname(os.path.abspath(monitor.__file__))
+    reference_dir = os.path.join(script_dir, monitor.BENCH_REFERENCE_DIR)
+    return ([os.path.join(script_dir, monitor.BENCH_INPUTS_FILE), os.path.join(reference_dir, "inputs.json")],
+            [os.path.join(script_dir, monitor.BENCH_BASELINE_FILE), os.path.join(reference_dir, "baseline.json")])
+
+
+def load_first_json(paths):
+    """The (path, contents) of the first of `paths` that holds valid JSON, or (None, None)."""
+    for path in paths:
+        try:
+            with open(path, "r") as f:
+                return path, json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            continue
+    return None, None
+
+
+def record_bench_inputs(monitor, path, max_pages=200):
+    """
+    Record the inputs `bench micro` runs on: the notice block texts of the last
+    `max_pages` archived /details pages (fake server pages for every inventory
+    site if the archive is empty), the latest saved results (fake ones if there
+    are none), and a credentials file shaped like the real one for every
+    inventory site, with placeholder passwords.
+    """
+    from fake_radial_suite import fake_details_page, fake_site_profile
+
+    inventory = monitor.load_site_inventory()
+    archive = monitor.PageArchive()
+    pages = []
+    for record in archive.captures()[-max_pages:]:
+        try:
+            pages.append(archive.load(record["sha256"]))
+        except (OSError, ValueError):
+            continue
+    source = f"{len(pages)} archived pages"
+    if not pages:
+        pages = [fake_details_page(site, fake_site_profile(site)) for site in inventory.names]
+        source = f"{len(pages)} fake pages"
+    notices = [[div.text() for div in monitor.parse_html(html).iter('div') if div.has_class('notice')]
+               for html in pages]
+    try:
+        results, _ = monitor.load_results()
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        results = [monitor.make_result(site, profile["internal_free"], profile["external_free"])
+                   for site, profile in ((site, fake_site_profile(site)) for site in inventory.names)]
+    inputs = {
+        "recorded": datetime.now().isoformat(timespec="seconds"),
+        "source": source,
+        "notices": notices,
+        "results": results,
+        "credentials": {"username": "bench", "passwords": {site: "x" * 16 for site in inventory.names}},
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(inputs, f)
+    os.replace(tmp_path, path)
+    print(f"Recorded benchmark inputs from {source} and {len(results)} results to {path}")
+    return inputs
+
+
+def micro_benchmarks(monitor, inputs, workdir):
+    """
+    The hot paths timed by `bench micro`, as {name: callable}; each call runs
+    the function over the whole recorded input set, like one collection run.
+    """
+    notices = [text for page in inputs["notices"] for text in page]
+    storage_blocks = [text for text in notices if monitor.is_storage_block(text)]
+    credentials_path = os.path.join(workdir, "credentials.json")
+    with open(credentials_path, "w") as f:
+        json.dump(inputs["credentials"], f)
+    figure_dir = os.path.join(workdir, "figure")
+    stamp = datetime(2025, 1, 27, 12, 0)
+
+    def parse():
+        for text in storage_blocks:
+            monitor.parse_free_percentage(text)
+
+    def notice_filter():
+        return [text for text in notices if monitor.is_storage_block(text)]
+
+    def figure():
+        # Always redraw: a cache hit would time a file lookup instead
+        monitor.create_figure(inputs["results"], figure_dir, timestamp=stamp, formats=["png"], cache=False)
+
+    def credentials():
+        monitor.load_credentials(credentials_path)
+
+    return {
+        f"parse_free_percentage ({len(storage_blocks)} blocks)": parse,
+        f"notice keyword filter ({len(notices)} blocks)": notice_filter,
+        f"create_figure ({len(inputs['results'])} sites)": figure,
+        f"load_credentials ({len(inputs['credentials']['passwords'])} sites)": credentials,
+    }
+
+
+def bench_micro(monitor, repeat=5, save_baseline=False, record=False):
+    """
+    Time parse_free_percentage, the notice block keyword filter, create_figure
+    and load_credentials on recorded inputs (see micro_data_paths; re-recorded
+    with `record`); their output is silenced unless --debug is given. Each
+    benchmark is looped until a round takes at least 0.2 s, and the best of
+    `repeat` rounds is compared with the baseline measured on the same inputs
+    (written next to the script with `save_baseline`). Returns False if any
+    benchmark is more than BENCH_REGRESSION_TOLERANCE slower, or if there is
+    no baseline to compare with and `save_baseline` is not given.
+    """
+    import platform
+    import timeit
+
+    inputs_paths, baseline_paths = micro_data_paths(monitor)
+    inputs_path, inputs = (None, None) if record else load_first_json(inputs_paths)
+    if inputs is None:
+        inputs_path, inputs = inputs_paths[0], record_bench_inputs(monitor, inputs_paths[0])
+
+    baseline_path, baseline = None, None
+    for path in baseline_paths:
+        candidate_path, candidate = load_first_json([path])
+        if candidate and candidate.get("inputs") == inputs["recorded"]:
+            baseline_path, baseline = candidate_path, candidate
+            break
+    if baseline and baseline.get("host") != platform.node():
+        print(f"Warning: Baseline {baseline_path} was measured on {baseline.get('host')}, not this host; "
+              f"timings may not be comparable (run with --save-baseline once to measure a local one)")
+
+    workdir = tempfile.mkdtemp(prefix="bench_micro_")
+    timings = {}
+    regressions = []
+    print(f"Micro-benchmarks on inputs recorded {inputs['recorded']} ({inputs['source']}, {inputs_path}), "
+          f"best of {repeat}:")
+    try:
+        for name, function in micro_benchmarks(monitor, inputs, workdir).items():
+            timer = timeit.Timer(function)
+            with redirect_stdout(sys.stdout if monitor.DEBUG_MODE else io.StringIO()):
+                loops, _ = timer.autorange()
+                rounds = [t / loops for t in timer.repeat(repeat=repeat, number=loops)]
+            timings[name] = {"best": min(rounds), "median": statistics.median(rounds), "loops": loops}
+            line = f"  {name:42s} {min(rounds) * 1000:9.3f} ms  (median {statistics.median(rounds) * 1000:.3f} ms)"
+            reference = (baseline or {}).get("benchmarks", {}).get(name)
+            if reference:
+                change = min(rounds) / reference["best"] - 1
+                line += f"  {change:+.0%} vs baseline"
+                if change > monitor.BENCH_REGRESSION_TOLERANCE:
+                    line += "  REGRESSION"
+                    regressions.append(name)
+            elif baseline:
+                line += "  (not in baseline)"
+            print(line)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if save_baseline:
+        with open(baseline_paths[0], "w") as f:
+            json.dump({"host": platform.node(), "python": platform.python_version(),
+                       "measured": datetime.now().isoformat(timespec="seconds"),
+                       "inputs": inputs["recorded"], "benchmarks": timings}, f, indent=2)
+        print(f"Saved baseline to {baseline_paths[0]}")
+    elif baseline is None:
+        print(f"Error: No baseline measured on the inputs recorded {inputs['recorded']} "
+              f"(looked in {', '.join(baseline_paths)}); nothing was checked. "
+              f"Run `bench micro --save-baseline` to store one.")
+        return False
+    if regressions:
+        print(f"{len(regressions)} of {len(timings)} benchmarks regressed by more than "
+              f"{monitor.BENCH_REGRESSION_TOLERANCE:.0%}")
+        return False
+    return True
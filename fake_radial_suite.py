@@ -0,0 +1,224 @@
+"""
+Local stand-in for the Radial Suite web server, so the collectors can be
+benchmarked and tested without the real sites. Started by the monitor's
+`fake-server` command and by `bench collectors`; see make_fake_server.
+"""
+
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+# Filler notices on the fake details page; none of them look like storage
+FAKE_STATUS_NOTICES = [
+    "Radial processing is running",
+    "Last radial file: RDLi_{site}_{stamp}.ruv",
+    "Time sync OK (offset 0.02 s)",
+    "Transmitter forward power 42 W, reflected 1 W",
+    "Receiver temperature 31 C",
+    "Diagnostics archive up to date",
+]
+
+
+def fake_site_names(count, known=()):
+    """The `known` site codes first, then made-up ones (S0024, S0025, ...) up to `count`."""
+    names = list(known)
+    return names[:count] + [f"S{i:04d}" for i in range(len(names) + 1, count + 1)]
+
+
+def fake_site_profile(site, seed=0, timeout_rate=0.0, login_failure_rate=0.0):
+    """
+    Deterministic behaviour of one fake site: its details layout ("notice" or
+    "processor"), free percentages, and whether it hangs or rejects logins.
+    The same draws are made whatever the rates, so changing one rate does not
+    reshuffle the storage values or the other fault.
+    """
+    import random
+    rnd = random.Random(f"{seed}:{site}")
+    return {
+        "layout": "processor" if rnd.random() < 0.5 else "notice",
+        "internal_free": rnd.randint(5, 95),
+        "external_free": rnd.randint(5, 95),
+        "timeout": rnd.random() < timeout_rate,
+        "login_fails": rnd.random() < login_failure_rate,
+    }
+
+
+def fake_details_page(site, profile):
+    """
+    A details page in one of the two layouts the collector understands: storage
+    reported in notice blocks ("X GB available out of Y GB [NN% avail.]"), or only
+    as "NN% free" notices inside the Processor repsection.
+    """
+    stamp = datetime.now().strftime("%Y_%m_%d_%H00")
+    filler = "".join(f'<div class="notice">{text.format(site=site, stamp=stamp)}</div>\n'
+                     for text in FAKE_STATUS_NOTICES)
+    if profile["layout"] == "notice":
+        volumes = ""
+        for name, pct, total in (("Boot", profile["internal_free"], 1000.24),
+                                 ("Codar", profile["external_free"], 4000.79)):
+            volumes += (f'<div class="notice">{name} Volume has {total * pct / 100:.2f} GB available '
+                        f'out of {total:.2f} GB [{pct}% avail.]</div>\n')
+        processor = f'<div class="collapse_tab">Processor</div>\n<div class="repsection">\n{volumes}</div>\n'
+    else:
+        processor = (f'<div class="collapse_tab">Processor <span class="arrow">&#9660;</span></div>\n'
+                     f'<div class="spacer"></div>\n<div class="repsection">\n'
+                     f'<div class="notice">Root partition: {profile["internal_free"]}% free</div>\n'
+                     f'<div class="notice"><p>Archive partition: {profile["external_free"]}% free</p></div>\n'
+                     f'</div>\n')
+    return (f'<html><head><title>{site} Radial Suite Web Server</title>'
+            f'<link rel="stylesheet" href="/{site}/style.css"></head><body>\n'
+            f'<div class="collapse_tab">Site</div>\n<div class="repsection">\n{filler}</div>\n'
+            f'{processor}<script>var refresh = 60;</script></body></html>')
+
+
+def fake_login_page(site, error=False):
+    message = '<p class="error">Invalid user name or password</p>' if error else ''
+    return (f'<html><head><title>{site} Radial Suite Web Server - Login</title>'
+            f'<link rel="stylesheet" href="/{site}/style.css"></head><body>{message}'
+            f'<form method="post" action="/{site}/login">'
+            f'<input type="hidden" name="login_referer" value="/{site}/status">'
+            f'User name <input type="text" name="login_username"> '
+            f'Password <input type="password" name="login_password"> '
+            f'<input type="submit" value="Log in"></form></body></html>')
+
+
+def make_fake_server(host="127.0.0.1", port=0, password=None, latency=0.0, jitter=0.0,
+                     timeout_rate=0.0, login_failure_rate=0.0, hang_seconds=30.0, seed=0, verbose=False):
+    """
+    Build (but don't start) a threaded HTTP server that mimics the Radial Suite
+    web server for any number of sites, each served under /<SITE>/ so one server
+    stands in for all of them (use --url-template 'http://host:port/{site}'):
+
+      /<SITE>          login form (login_username/login_password), or a redirect
+                       to /<SITE>/status when the session cookie is valid
+      /<SITE>/login    form POST target; sets the cookie and redirects to /status
+      /<SITE>/details  storage page, in the notice or Processor layout
+
+    Every response is delayed by `latency` +/- `jitter` seconds. A share of the
+    sites (`timeout_rate`) stalls each response for `hang_seconds`, and another
+    share (`login_failure_rate`) rejects every login. `password` None accepts
+    any non-empty password. Request counts are kept in server.fake_requests;
+    requests are logged to stderr only if `verbose`.
+    """
+    import hashlib
+    import random
+    from http.cookies import SimpleCookie
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs
+
+    profiles = {}
+    profiles_lock = threading.Lock()
+
+    def profile_for(site):
+        with profiles_lock:
+            if site not in profiles:
+                profiles[site] = fake_site_profile(site, seed, timeout_rate, login_failure_rate)
+            return profiles[site]
+
+    def session_token(site):
+        return hashlib.sha1(f"{seed}:{site}".encode()).hexdigest()[:24]
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        server_version = "RadialSuiteWebServer/fake"
+        # Headers and body go out in separate writes; don't let Nagle hold the body back
+        disable_nagle_algorithm = True
+
+        def send_page(self, code, body="", content_type="text/html", headers=()):
+            payload = body.encode()
+            self.send_response(code)
+            for name, value in headers:
+                self.send_header(name, value)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def route(self):
+            """Apply the simulated latency/stall and split the path into (site, page)."""
+            parts = urlsplit(self.path).path.strip("/").split("/", 1)
+            site = parts[0]
+            page = parts[1] if len(parts) > 1 else ""
+            with self.server.stats_lock:
+                key = page or "root"
+                self.server.fake_requests[key] = self.server.fake_requests.get(key, 0) + 1
+            delay = latency + (random.uniform(-jitter, jitter) if jitter else 0.0)
+            if site and profile_for(site)["timeout"]:
+                delay += hang_seconds
+            if delay > 0:
+                time.sleep(delay)
+            return site, page
+
+        def is_logged_in(self, site):
+            cookie = SimpleCookie(self.headers.get("Cookie") or "")
+            return "RSSESSION" in cookie and cookie["RSSESSION"].value == session_token(site)
+
+        def do_GET(self):
+            site, page = self.route()
+            if not site or page == "favicon.ico":
+                self.send_page(404, "not found", "text/plain")
+            elif page == "style.css":
+                self.send_page(200, "body { font-family: sans-serif; } .notice { margin: 2px; }", "text/css")
+            elif not self.is_logged_in(site):
+                self.send_page(200, fake_login_page(site))
+            elif page in ("", "login"):
+                self.send_page(303, headers=[("Location", f"/{site}/status")])
+            elif page == "status":
+                self.send_page(200, f"<html><head><title>{site} Status</title></head>"
+                                    f"<body><a href=\"/{site}/details\">Details</a></body></html>")
+            elif page == "details":
+                self.send_page(200, fake_details_page(site, profile_for(site)))
+            else:
+                self.send_page(404, "not found", "text/plain")
+
+        def do_POST(self):
+            site, page = self.route()
+            length = int(self.headers.get("Content-Length") or 0)
+            fields = parse_qs(self.rfile.read(length).decode(errors="replace"))
+            user = fields.get("login_username", [""])[0]
+            given = fields.get("login_password", [""])[0]
+            accepted = (user and given and (password is None or given == password)
+                        and not profile_for(site)["login_fails"])
+            if not accepted:
+                self.send_page(200, fake_login_page(site, error=True))
+                return
+            self.send_page(303, headers=[
+                ("Location", f"/{site}/status"),
+                ("Set-Cookie", f"RSSESSION={session_token(site)}; Path=/{site}; Max-Age=86400; HttpOnly"),
+            ])
+
+        def log_message(self, format, *args):
+            if verbose:
+                super().log_message(format, *args)
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        # Room for many sites connecting at once
+        request_queue_size = 256
+
+        def handle_error(self, request, client_address):
+            # Collectors that time out on a stalling site just hang up
+            if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+                super().handle_error(request, client_address)
+
+    server = Server((host, port), Handler)
+    server.fake_requests = {}
+    server.stats_lock = threading.Lock()
+    return server
+
+
+def serve_fake_radial_suite(host, port, **options):
+    """Run the stand-in server in the foreground until Ctrl-C (the `fake-server` command)."""
+    server = make_fake_server(host, port, **options)
+    address = f"http://{host}:{server.server_port}"
+    # The first line is read by `bench collectors` to find the port
+    print(f"Fake Radial Suite server listening on {address}", flush=True)
+    print(f"Collect against it with: --url-template '{address}/{{site}}'", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping fake server.")
+    finally:
+        server.server_close()
@@ -0,0 +1,21 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(REPO_DIR, "25_01_27_computer_space_bars_v3.py")
+
+# The monitor imports its helper modules (bench, fake_radial_suite) from its own folder
+sys.path.insert(0, REPO_DIR)
+
+
+@pytest.fixture(scope="session")
+def monitor():
+    """The monitor script, loaded as a module (its file name is not importable)."""
+    spec = importlib.util.spec_from_file_location("monitor", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["monitor"] = module
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,94 @@
+import pytest
+
+RUN_TS = 1_700_000_000.0
+
+
+@pytest.fixture(autouse=True)
+def alert_settings(monitor, monkeypatch):
+    monkeypatch.setattr(monitor, "ALERT_HYSTERESIS", 2)
+    monkeypatch.setattr(monitor, "ALERT_FAILURE_RUNS", 2)
+    monkeypatch.setattr(monitor, "ALERT_FORECAST_DAYS", 7)
+
+
+def run(monitor, state, internal, status=None, days_to_red=None, run=0):
+    """Evaluate one run of site S with `internal` free (external stays green) and return the event kinds."""
+    result = monitor.make_result("S", internal, 80 if internal is not None else None, status)
+    forecasts = {"S": {"internal": {"days_to_red": days_to_red}}}
+    events = monitor.evaluate_alerts([result], forecasts, state, RUN_TS + run * 900)
+    return [(e["kind"], e.get("band")) for e in events]
+
+
+@pytest.mark.parametrize("values, previous, bands", [
+    # Leaving green for yellow at 49, back to green only 2 points above 50
+    ([49, 51, 52], None, ["yellow", "yellow", "green"]),
+    # Dropping a band is immediate
+    ([52, 49.9], "green", ["green", "yellow"]),
+    # Red at 19; 22 is 2 points above the orange threshold (20)
+    ([19, 21, 22], None, ["red", "red", "orange"]),
+    # A big recovery only stops short of the better bands' margins
+    ([10, 51], "red", ["red", "yellow"]),
+    ([10, 52], "red", ["red", "green"]),
+])
+def test_band_with_hysteresis(monitor, values, previous, bands):
+    seen = []
+    for value in values:
+        previous = monitor.band_with_hysteresis(value, previous)
+        seen.append(previous)
+    assert seen == bands
+
+
+def test_band_events_flip_back_only_past_the_margin(monitor):
+    state = {}
+    assert run(monitor, state, 49) == [("band", "yellow")]
+    assert run(monitor, state, 51) == []
+    assert run(monitor, state, 52) == [("band", "green")]
+    assert run(monitor, state, 52) == []
+
+
+def test_red_to_orange(monitor):
+    state = {}
+    assert run(monitor, state, 19) == [("band", "red")]
+    assert run(monitor, state, 21) == []
+    assert run(monitor, state, 22) == [("band", "orange")]
+    assert state["S"]["bands"] == {"internal": "orange", "external": "green"}
+
+
+def test_failed_and_recovered(monitor):
+    state = {}
+    assert run(monitor, state, 80) == []
+    # One failed run is not enough, the second one alerts, later ones stay quiet
+    assert run(monitor, state, None, status="login_failed") == []
+    assert run(monitor, state, None, status="no_data") == [("failed", None)]
+    assert run(monitor, state, None, status="no_data") == []
+    assert state["S"]["failing"] and state["S"]["failures"] == 3
+    assert run(monitor, state, 80) == [("recovered", None)]
+    assert run(monitor, state, 80) == []
+    assert state["S"]["failures"] == 0 and not state["S"]["failing"]
+
+
+def test_single_failure_does_not_recover(monitor):
+    state = {}
+    run(monitor, state, 80)
+    assert run(monitor, state, None, status="timeout") == []
+    assert run(monitor, state, 80) == []
+
+
+def test_forecast_rearm(monitor):
+    state = {}
+    assert run(monitor, state, 60, days_to_red=5) == [("forecast", None)]
+    # Still armed off: within the window, or not yet twice as far away
+    assert run(monitor, state, 60, days_to_red=5) == []
+    assert run(monitor, state, 60, days_to_red=14) == []
+    assert run(monitor, state, 60, days_to_red=6) == []
+    # More than twice ALERT_FORECAST_DAYS away re-arms it
+    assert run(monitor, state, 60, days_to_red=15) == []
+    assert run(monitor, state, 60, days_to_red=6) == [("forecast", None)]
+    # So does the forecast going away
+    assert run(monitor, state, 60, days_to_red=None) == []
+    assert run(monitor, state, 60, days_to_red=3) == [("forecast", None)]
+
+
+def test_no_forecast_event_once_red(monitor):
+    state = {}
+    assert run(monitor, state, 15, days_to_red=0) == [("band", "red")]
+    assert state["S"]["forecast"] == {"internal": True}
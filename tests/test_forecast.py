@@ -0,0 +1,67 @@
+import math
+
+import numpy as np
+import pytest
+
+DAY = 86400.0
+NOW = 1_700_000_000.0
+
+
+def series(internal, external=None):
+    """One site's daily readings, the last one taken at NOW."""
+    external = [math.nan] * len(internal) if external is None else external
+    n = len(internal)
+    ts = np.array([NOW - (n - 1 - i) * DAY for i in range(n)])
+    free = np.column_stack([np.array(internal, dtype=float), np.array(external, dtype=float)])
+    return np.array(["SITE"] * n), ts, free
+
+
+def forecast(monitor, internal, external=None, **kwargs):
+    sites, ts, free = series(internal, external)
+    return monitor.forecast_fill(sites, ts, free, now=NOW, **kwargs)["SITE"]
+
+
+@pytest.mark.parametrize("internal, days_to_red, days_to_empty, label", [
+    # shrinking 2%/day from 54%: red (20%) in 17 days, empty in 27
+    ([60, 58, 56, 54], 17.0, 27.0, "red in ~17d"),
+    # flat: never crosses anything
+    ([50, 50, 50, 50], None, None, ""),
+    # already red and shrinking 1%/day: only the time to full is shown
+    ([15, 14, 13, 12], 0.0, 12.0, "full in ~12d"),
+    # already red but flat: nothing to say
+    ([10, 10, 10], 0.0, None, ""),
+    # shrinking 0.1%/day from 89.7%: red in ~697 days, past FORECAST_HORIZON_DAYS
+    ([90, 89.9, 89.8, 89.7], None, None, ""),
+])
+def test_forecast_fill_and_label(monitor, internal, days_to_red, days_to_empty, label):
+    result = forecast(monitor, internal)["internal"]
+    assert result["days_to_red"] == days_to_red
+    assert result["days_to_empty"] == days_to_empty
+    assert monitor.format_forecast(result) == label
+
+
+def test_nan_gaps_are_skipped(monitor):
+    result = forecast(monitor, [60, math.nan, 56, math.nan, 52])
+    # Fitted on the three readings only: -2%/day from 52%
+    assert result["internal"] == {"slope_per_day": -2.0, "days_to_red": 16.0, "days_to_empty": 26.0}
+    assert monitor.format_forecast(result["internal"]) == "red in ~16d"
+    # A volume that was never read gets no forecast
+    assert result["external"] == {"slope_per_day": None, "days_to_red": None, "days_to_empty": None}
+    assert monitor.format_forecast(result["external"]) == ""
+
+
+def test_too_few_samples(monitor):
+    result = forecast(monitor, [60, math.nan, math.nan, 50], min_samples=3)["internal"]
+    assert result == {"slope_per_day": None, "days_to_red": None, "days_to_empty": None}
+
+
+def test_series_are_fitted_independently(monitor):
+    sites = np.array(["A", "B"] * 4)
+    ts = np.repeat([NOW - 3 * DAY, NOW - 2 * DAY, NOW - DAY, NOW], 2)
+    free = np.array([[60, 50], [50, 50], [58, 50], [50, 50],
+                     [56, 50], [50, 50], [54, 50], [50, 50]], dtype=float)
+    result = monitor.forecast_fill(sites, ts, free, now=NOW)
+    assert result["A"]["internal"]["days_to_red"] == 17.0
+    assert result["B"]["internal"]["days_to_red"] is None
+    assert monitor.format_forecast(result["A"]["external"]) == ""
+    assert monitor.format_forecast(None) == ""
@@ -0,0 +1,64 @@
+import asyncio
+import threading
+
+import pytest
+
+from fake_radial_suite import fake_site_names, fake_site_profile, make_fake_server
+
+
+@pytest.fixture
+def fake_suite(monitor, tmp_path):
+    """
+    The stand-in Radial Suite server on a free port, with the collectors pointed
+    at it: a site in each page layout with the right password and one more with
+    a wrong one. Yields (sites, profiles); the settings are restored afterwards.
+    """
+    names = fake_site_names(100, monitor.load_site_inventory().names)
+    profiles = {site: fake_site_profile(site) for site in names}
+    notice_site = next(site for site in names if profiles[site]["layout"] == "notice")
+    processor_site = next(site for site in names if profiles[site]["layout"] == "processor")
+    rejected_site = next(site for site in names if site not in (notice_site, processor_site))
+
+    server = make_fake_server(port=0, password="test")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    previous = monitor.configure_collection(
+        username="test", passwords={notice_site: "test", processor_site: "test", rejected_site: "wrong"},
+        url_template=f"http://127.0.0.1:{server.server_port}/{{site}}", cookie_path=str(tmp_path / "cookies"))
+    monitor.reset_run_stats()
+    try:
+        yield {"good": [notice_site, processor_site], "rejected": rejected_site}, profiles
+    finally:
+        server.shutdown()
+        server.server_close()
+        # Back to the real cookie folder; nothing is flushed into the temporary one at exit
+        monitor.configure_collection(**previous)
+        monitor.reset_run_stats()
+
+
+def collect(monitor, sites):
+    monitor.reset_run_stats()
+    results, failed_sites = asyncio.run(monitor.collect_http_async(sites, 4))
+    logins = {r["site"] for r in monitor.phase_timings if r["phase"] == "http_login"}
+    return dict(zip(sites, results)), failed_sites, logins
+
+
+def test_http_backend_against_the_stand_in_server(monitor, fake_suite):
+    sites, profiles = fake_suite
+    good, rejected = sites["good"], sites["rejected"]
+
+    by_site, failed_sites, logins = collect(monitor, good + [rejected])
+    for site in good:
+        assert (by_site[site]["internal_free"], by_site[site]["external_free"]) == \
+            (profiles[site]["internal_free"], profiles[site]["external_free"]), profiles[site]["layout"]
+        assert by_site[site]["status"] == "ok"
+    # A wrong password is rejected and left for the Selenium fallback
+    assert by_site[rejected] is None
+    assert failed_sites == [rejected]
+    # Sites without saved cookies log in
+    assert set(good) <= logins
+
+    # The second pass reuses the saved session cookies
+    by_site, failed_sites, logins = collect(monitor, good + [rejected])
+    assert [by_site[site]["status"] for site in good] == ["ok", "ok"]
+    assert failed_sites == [rejected]
+    assert not logins & set(good)
@@ -0,0 +1,24 @@
+import re
+
+
+def test_repeated_page_loads_are_summed(monitor, tmp_path):
+    monitor.reset_run_stats()
+    try:
+        monitor.page_stats.extend([
+            {"site": "AMAG", "page": "details", "bytes": 1000, "load_ms": 200.0, "resources": 3, "lean": False},
+            {"site": "AMAG", "page": "login", "bytes": 500, "load_ms": 100.0, "resources": 2, "lean": False},
+            # /details again after a re-login
+            {"site": "AMAG", "page": "details", "bytes": 1500, "load_ms": 300.0, "resources": 3, "lean": False},
+        ])
+        prom_path = monitor.export_timings(1_700_000_000.0, metrics_dir=str(tmp_path))
+    finally:
+        monitor.reset_run_stats()
+
+    with open(prom_path) as f:
+        samples = [line for line in f.read().splitlines() if line and not line.startswith("#")]
+    # Every metric name + label set appears once, as the textfile collector requires
+    series = [re.sub(r" \S+$", "", line) for line in samples]
+    assert len(series) == len(set(series))
+    assert 'maracoos_collector_page_bytes{site="AMAG",page="details",lean="false"} 2500' in samples
+    assert 'maracoos_collector_page_load_seconds{site="AMAG",page="details",lean="false"} 0.500' in samples
+    assert 'maracoos_collector_page_bytes{site="AMAG",page="login",lean="false"} 500' in samples
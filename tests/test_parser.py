@@ -0,0 +1,92 @@
+import re
+
+import pytest
+
+
+def baseline_parse_free_percentage(text_block):
+    """parse_free_percentage as it was before parse_volumes (one re.search per format)."""
+    if not text_block:
+        return None
+    match_bracket = re.search(r'\[(\d+)\%\s*avail\.\]', text_block, re.IGNORECASE)
+    if match_bracket:
+        return int(match_bracket.group(1))
+    match_avail = re.search(r'(\d+)\%\s*avail\.', text_block, re.IGNORECASE)
+    if match_avail:
+        return int(match_avail.group(1))
+    match_available = re.search(r'(\d+)\%\s*available', text_block, re.IGNORECASE)
+    if match_available:
+        return int(match_available.group(1))
+    match_free = re.search(r'(\d+)\%\s*free', text_block, re.IGNORECASE)
+    if match_free:
+        return int(match_free.group(1))
+    match_used = re.search(r'(\d+)\%\s*used', text_block, re.IGNORECASE)
+    if match_used:
+        return 100 - int(match_used.group(1))
+    match_gb = re.search(r'(\d+\.?\d*)\s*gb\s*available\s*out\s*of\s*(\d+\.?\d*)\s*gb', text_block, re.IGNORECASE)
+    if match_gb:
+        available = float(match_gb.group(1))
+        total = float(match_gb.group(2))
+        if total > 0:
+            return int((available / total) * 100)
+    return None
+
+
+# Blocks on which the new parser must agree with the old one
+SAME_AS_BASELINE = [
+    "Boot Volume has 476.47 GB available out of 1000.24 GB [48% avail.]",
+    "CODAR Archives has 1.2 GB available out of 3999.7 GB [0% avail.]",
+    "Boot Volume has 476.47 GB available out of 1000.24 GB",
+    "boot volume HAS 10GB AVAILABLE OUT OF 40GB",
+    "Disk has 0 GB available out of 0 GB",
+    "Disk has 0 GB available out of 0.0 GB [48% avail.]",
+    "Disk has 0 GB available out of 0GB 12% used",
+    "Storage 63% avail.",
+    "Storage 63%avail.",
+    "Storage 63% available",
+    "Storage 63 % available",
+    "Disk 27% free",
+    "Disk 27% used",
+    "Disk 100% used",
+    "Disk 12% used, 30% free",
+    "Disk 12% free [40% avail.]",
+    "Disk 12% avail. [40% avail.]",
+    "Disk 12% available, 13% avail.",
+    "Boot Volume has 10 GB available out of 20 GB [70% avail.]\nArchive has 1 GB available out of 4 GB [25% avail.]",
+    "Boot Volume has 10 GB available out of 20 GB 35% available",
+    "Volume has 300 GB available out of 200 GB",
+    "Time sync OK (offset 0.02 s)",
+    "Radial processing is running",
+    "",
+    None,
+]
+
+# Blocks where the old parser gave up and the new one reads the next statement:
+# the old GB fallback only ever looked at the first "out of" statement, so a
+# zero total there hid the valid one after it.
+IMPROVED_OVER_BASELINE = [
+    ("Disk has 5 GB available out of 0 GB, then 10 GB available out of 20 GB", 50),
+    ("0gb available out of 0 gb; 3 GB available out of 6 GB", 50),
+]
+
+
+@pytest.mark.parametrize("text", SAME_AS_BASELINE)
+def test_parse_free_percentage_matches_baseline(monitor, text):
+    assert monitor.parse_free_percentage(text) == baseline_parse_free_percentage(text)
+
+
+@pytest.mark.parametrize("text, expected", IMPROVED_OVER_BASELINE)
+def test_zero_total_is_skipped(monitor, text, expected):
+    assert baseline_parse_free_percentage(text) is None
+    assert monitor.parse_free_percentage(text) == expected
+
+
+def test_parse_volumes_records(monitor):
+    text = ("Boot Volume has 476.47 GB available out of 1000.24 GB [48% avail.]\n"
+            "CODAR Archives has 1500 GB available out of 4000 GB\n"
+            "Scratch 12% used")
+    assert monitor.parse_volumes(text) == [
+        monitor.VolumeRecord("Boot Volume", 476.47, 1000.24, 48, "bracket"),
+        monitor.VolumeRecord("CODAR Archives", 1500.0, 4000.0, 37, "gb"),
+        monitor.VolumeRecord(None, None, None, 88, "used"),
+    ]
+    assert monitor.parse_volumes("") == []
@@ -0,0 +1,35 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("matplotlib")
+
+
+@pytest.fixture
+def results(monitor):
+    sites = monitor.load_site_inventory().names[:3]
+    return [monitor.make_result(site, 60 - 10 * i, 40) for i, site in enumerate(sites)]
+
+
+def test_explicit_timestamp_is_part_of_the_cache_key(monitor, results, tmp_path, monkeypatch):
+    monkeypatch.setattr(monitor, "RENDER_CACHE", True)
+    noon = datetime(2025, 1, 27, 12, 0)
+    first = monitor.create_figure(results, str(tmp_path), timestamp=noon, formats=["json"])
+    assert first == [f"{tmp_path}/MARACOOS_Storage_Space_20250127_1200.json"]
+    # Same data and time: the cached figure is kept
+    assert monitor.create_figure(results, str(tmp_path), timestamp=noon, formats=["json"]) == first
+    # Same data at another time (render --as-of): a figure of that time is drawn
+    earlier = monitor.create_figure(results, str(tmp_path), timestamp=datetime(2025, 1, 20, 6, 0),
+                                    formats=["json"])
+    assert earlier == [f"{tmp_path}/MARACOOS_Storage_Space_20250120_0600.json"]
+
+
+def test_live_runs_reuse_an_unchanged_figure(monitor, results, tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(monitor, "RENDER_CACHE", True)
+    monitor.create_figure(results, str(tmp_path), formats=["json"])
+    capsys.readouterr()
+    monitor.create_figure(results, str(tmp_path), formats=["json"])
+    assert "Figure unchanged" in capsys.readouterr().out
+    changed = [dict(results[0], internal_free=5)] + results[1:]
+    monitor.create_figure(changed, str(tmp_path), formats=["json"])
+    assert "Figure unchanged" not in capsys.readouterr().out